@@ -0,0 +1,286 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, NamedTuple, Optional
+
+import streamlit as st
+from gspread.utils import a1_to_rowcol
+from streamlit.testing.v1 import AppTest
+
+from daily_rollover import RolloverScheduler
+from fake_sheets import FakeBackend, FakeSpreadsheet, installed
+from inventory_poller import InventoryPoller
+from metrics import TIMER_KEY
+from order_journal import JournalFlusher, OrderJournal
+from store_config import COUNTER_CELLS, SALESLOG_NAME, SHEET_NAME
+
+# --- Cashier Action Benchmark ---
+# Drives sales_inventory_app.py through AppTest against the in-memory
+# Sheets stand-in and reports, per user action, the Sheets requests it
+# cost (including the background journal flush) and its wall time.
+# Exits non-zero when a flow goes over the stored budget.
+HERE = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(HERE, "sales_inventory_app.py")
+BUDGET_PATH = os.path.join(HERE, "benchmark_budget.json")
+DEFAULT_LATENCY = 0.1  # seconds per fake Sheets request
+SETTLE_QUIET = 0.5     # seconds without requests before a flow counts as settled
+SETTLE_TIMEOUT = 60
+STOCK_ROWS = range(17, 49)
+STOCK_COLS = (7, 9, 13)  # G, I, M
+SALESLOG_HEADER = ["Date", "Time", "Product", "Packaging", "Size/Flavor", "Qty", "Amount", "Order ID"]
+CLICK_TARGET = 0.05  # seconds of script time per cart click
+
+def template_spreadsheet(backend):
+    # The two template tabs the daily sheets are copied from
+    spreadsheet = FakeSpreadsheet(backend)
+    inventory = {a1_to_rowcol(cell): "0" for cell in COUNTER_CELLS}
+    inventory.update({(row, col): "10" for row in STOCK_ROWS for col in STOCK_COLS})
+    spreadsheet.seed_worksheet(SHEET_NAME, inventory)
+    spreadsheet.seed_worksheet(SALESLOG_NAME, {(1, col): name for col, name in enumerate(SALESLOG_HEADER, 1)})
+    return spreadsheet
+
+# --- AppTest helpers ---
+def widget(elements, label):
+    return next(element for element in elements if element.label == label)
+
+def check(at):
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return at
+
+def open_tab(at, tab):
+    check(widget(at.selectbox, "Select Tab").set_value(tab).run())
+
+def pick_item(at, product, packaging, size, qty=1):
+    check(widget(at.selectbox, "Select Product").set_value(product).run())
+    if product == "Pizza":
+        widget(at.selectbox, "Select Pizza Flavor").set_value(size)
+    else:
+        widget(at.selectbox, "Select Packaging").set_value(packaging)
+        widget(at.selectbox, "Select Size").set_value(size)
+    at.number_input(key="qty").set_value(qty)
+
+def add_item(at, product, packaging, size, qty=1):
+    pick_item(at, product, packaging, size, qty)
+    check(at.button(key="add_to_order_btn").click().run())
+
+def checkout(at):
+    at.number_input(key="cash_received").set_value(10000)
+    check(at.button(key="submit_order_btn").click().run())
+    check(at.button(key="ok_btn").click().run())
+
+@contextmanager
+def stock_edits(edits):
+    # AppTest can't type into st.data_editor, so apply {(row, column): value}
+    # to what it returns, as if the cashier had edited those cells.
+    original = st.data_editor
+    def data_editor(data, **kwargs):
+        edited = original(data, **kwargs).copy()
+        for (row, column), value in edits.items():
+            edited.loc[row, column] = value
+        return edited
+    st.data_editor = data_editor
+    try:
+        yield
+    finally:
+        st.data_editor = original
+
+# --- Flows ---
+class Flow(NamedTuple):
+    name: str
+    setup: Optional[Callable]  # not measured; None means a cold start
+    action: Callable
+    interactive_target: Optional[float] = None  # fixed budget instead of a measured one
+
+def cold_open(at):
+    # Fresh process state: no client, no sheet handles, nothing cached
+    check(at.run())
+
+def first_sale(at):
+    check(at.run())
+    add_item(at, "Buko Juice", "Cup", "Small")
+    checkout(at)
+
+def five_item_order(at):
+    add_item(at, "Buko Juice", "Cup", "Small")
+    add_item(at, "Buko Juice", "Bottle", "Large", 2)
+    add_item(at, "Buko Shake", "Cup", "Medium")
+    add_item(at, "Pizza", "Box", "Hawaiian")
+    add_item(at, "Pizza", "Box", "Pepperoni", 3)
+    checkout(at)
+
+def cart_add(at):
+    check(at.button(key="add_to_order_btn").click().run())
+
+def cart_remove(at):
+    # The cart's X button
+    check(next(button for button in at.button if (button.key or "").startswith("remove_")).click().run())
+
+def remove_order(at):
+    check(at.button(key="remove_order_btn").click().run())
+
+def void_setup(at):
+    check(at.run())
+    add_item(at, "Buko Shake", "Bottle", "Medium", 2)
+    checkout(at)
+    open_tab(at, "Remove Order")
+
+def void_order(at):
+    picker = at.selectbox(key="void_pick")
+    check(picker.select_index(0).run())
+    check(at.button(key="void_order_btn").click().run())
+
+def stocks_save(at):
+    with stock_edits({(0, "Beg. Bal"): 25, (5, "Qty. In"): 3}):
+        check(at.button(key="save_stocks_btn").click().run())
+
+def summary_refresh(at):
+    check(widget(at.button, "Refresh Inventory").click().run())
+
+FLOWS = [
+    Flow("cold_open", None, cold_open),
+    Flow("first_sale", None, first_sale),
+    Flow("five_item_order", lambda at: check(at.run()), five_item_order),
+    Flow("cart_add", lambda at: (check(at.run()), pick_item(at, "Buko Juice", "Cup", "Small")), cart_add, CLICK_TARGET),
+    Flow("cart_remove", lambda at: (check(at.run()), add_item(at, "Buko Juice", "Cup", "Small")), cart_remove, CLICK_TARGET),
+    Flow("remove_order", lambda at: (check(at.run()), open_tab(at, "Remove Order")), remove_order),
+    Flow("void_order", void_setup, void_order),
+    Flow("stocks_save", lambda at: (check(at.run()), open_tab(at, "Stocks Inventory")), stocks_save),
+    Flow("summary_refresh", lambda at: (check(at.run()), open_tab(at, "Sales Summary")), summary_refresh),
+]
+
+# --- Runner ---
+def stop_background_threads():
+    # The previous flow's background threads hold its fake spreadsheet
+    for thread in threading.enumerate():
+        if isinstance(thread, (JournalFlusher, RolloverScheduler, InventoryPoller)):
+            thread.stop()
+
+def settle(backend, journal):
+    deadline = time.monotonic() + SETTLE_TIMEOUT
+    while journal.pending_count() or backend.idle_for() < SETTLE_QUIET:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"{journal.pending_count()} journal entries still unsynced after {SETTLE_TIMEOUT}s")
+        time.sleep(0.05)
+
+def run_flow(flow, workdir, latency, throttle_rate, seed):
+    stop_background_threads()
+    st.cache_resource.clear()
+    os.environ["ORDER_JOURNAL_PATH"] = os.path.join(workdir, f"{flow.name}_journal.db")
+    os.environ["SALES_STORE_PATH"] = os.path.join(workdir, f"{flow.name}_history.db")
+    # Budgets are per action; the shared poller's reads are per process
+    os.environ["INVENTORY_POLLER"] = "off"
+    journal = OrderJournal(os.environ["ORDER_JOURNAL_PATH"])
+    backend = FakeBackend(latency=0.0)
+    with installed(template_spreadsheet(backend)):
+        at = AppTest.from_file(APP_PATH, default_timeout=SETTLE_TIMEOUT)
+        if flow.setup is not None:
+            flow.setup(at)
+            settle(backend, journal)
+        backend.latency, backend.throttle_rate = latency, throttle_rate
+        backend.seed(seed)
+        backend.reset_stats()
+        started = time.monotonic()
+        error = None
+        try:
+            flow.action(at)
+        except Exception as e:
+            error = str(e)
+        ui_seconds = time.monotonic() - started
+        # Into the action's last script run, when its page became usable
+        timer = at.session_state[TIMER_KEY] if TIMER_KEY in at.session_state else None
+        interactive_seconds = timer.interactive_at if timer is not None else None
+        settle(backend, journal)
+    stats = backend.stats()
+    stats.update(
+        flow=flow.name,
+        ui_seconds=round(ui_seconds, 3),
+        interactive_seconds=round(interactive_seconds, 3) if interactive_seconds is not None else None,
+        # Until the last request of the action, background flush included
+        sync_seconds=round(max(ui_seconds, time.monotonic() - backend.idle_for() - started), 3),
+        error=error
+    )
+    return stats
+
+def check_budget(result, budget, compare_time):
+    if budget is None:
+        return []
+    limits = budget.get("flows", {}).get(result["flow"])
+    if limits is None:
+        return ["no budget"]
+    over = [
+        f"{name} {result[name]} > {limits[name]}"
+        for name in ("reads", "writes")
+        if result[name] > limits[name]
+    ]
+    if compare_time:
+        over += [
+            f"{name} {result[name]} > {limits[name]}"
+            for name in ("ui_seconds", "interactive_seconds")
+            if name in limits and result[name] is not None and result[name] > limits[name]
+        ]
+    return over
+
+def budget_from(results, latency):
+    # Request counts are exact; wall time gets room for slower machines,
+    # except where a flow has a fixed target
+    targets = {flow.name: flow.interactive_target for flow in FLOWS}
+    flows = {}
+    for r in results:
+        flows[r["flow"]] = {"reads": r["reads"], "writes": r["writes"], "ui_seconds": round(max(1.0, 2 * r["ui_seconds"]), 1)}
+        if targets.get(r["flow"]) is not None:
+            flows[r["flow"]]["interactive_seconds"] = targets[r["flow"]]
+        elif r["interactive_seconds"] is not None:
+            flows[r["flow"]]["interactive_seconds"] = round(max(0.5, 2 * r["interactive_seconds"]), 1)
+    return {"latency": latency, "flows": flows}
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure Sheets requests and wall time per cashier action.")
+    parser.add_argument("--flows", nargs="*", choices=[flow.name for flow in FLOWS], help="flows to run (default: all)")
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY, help="seconds added to every fake Sheets request")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered with a 429")
+    parser.add_argument("--seed", type=int, default=0, help="seed for 429 injection")
+    parser.add_argument("--budget", default=BUDGET_PATH, help="budget file to check against")
+    parser.add_argument("--update-budget", action="store_true", help="write this run's results as the new budget")
+    args = parser.parse_args(argv)
+
+    flows = [flow for flow in FLOWS if not args.flows or flow.name in args.flows]
+    with tempfile.TemporaryDirectory() as workdir:
+        results = [run_flow(flow, workdir, args.latency, args.throttle_rate, args.seed) for flow in flows]
+        stop_background_threads()
+
+    if args.update_budget:
+        with open(args.budget, "w") as f:
+            json.dump(budget_from(results, args.latency), f, indent=2)
+            f.write("\n")
+        print(f"Budget written to {args.budget}")
+    budget = {}
+    if os.path.exists(args.budget):
+        with open(args.budget) as f:
+            budget = json.load(f)
+    # Budgets describe a fault-free run; with 429s injected only errors fail.
+    # Wall time is only comparable at the latency the budget was recorded with.
+    compare_time = budget.get("latency") == args.latency
+    if args.throttle_rate:
+        budget = None
+
+    failed = False
+    print(f"{'flow':<18}{'reads':>6}{'writes':>7}{'429s':>6}{'ui s':>8}{'tti s':>8}{'sync s':>8}  result")
+    for r in results:
+        problems = [r["error"]] if r["error"] else check_budget(r, budget, compare_time)
+        failed = failed or bool(problems)
+        print(
+            f"{r['flow']:<18}{r['reads']:>6}{r['writes']:>7}{r['throttled']:>6}"
+            f"{r['ui_seconds']:>8.2f}{r['interactive_seconds'] or 0:>8.2f}{r['sync_seconds']:>8.2f}  {'; '.join(problems) or 'ok'}"
+        )
+        print(f"{'':<18}{json.dumps(r['calls'], sort_keys=True)}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+import json
+import os
+
+import numpy as np
+
+from sku_catalog import SKUS
+from store_config import STOCK_ITEMS
+
+# --- Bill of Materials ---
+# Raw stock used per unit sold, compiled into one SKU x stock-item
+# matrix: theoretical usage for any set of sales is counts @ BOM.
+# Recipes come from RECIPES_FILE, a JSON object mapping SKU labels (as in
+# the catalog, e.g. "Buko Juice - Cup - Small") to {stock item: quantity
+# per unit}, in the units the Stocks Inventory sheet is counted in. SKUs
+# and stock items without a recipe stay manual; with no file, all do.
+# recipes.example.json covers only the packaging used per unit sold; copy
+# it to recipes.json and add the store's own ingredient quantities, e.g.
+#   "Buko Shake - Cup - Small": {"S-Cup": 1, "Straw": 1, "buko": <qty>, "Milk": <qty>}
+RECIPES_FILE = os.environ.get("RECIPES_FILE", "recipes.json")
+
+STOCK_INDEX = {item: i for i, item in enumerate(STOCK_ITEMS)}
+SKU_BY_LABEL = {sku.label: sku for sku in SKUS}
+
+def load_recipes(path):
+    with open(path) as f:
+        recipes = json.load(f)
+    # A misspelt name would silently count as zero usage
+    unknown = [label for label in recipes if label not in SKU_BY_LABEL]
+    unknown += [item for items in recipes.values() for item in items if item not in STOCK_INDEX]
+    if unknown:
+        raise ValueError(f"{path}: unknown SKUs or stock items: {', '.join(unknown)}")
+    return recipes
+
+RECIPES = load_recipes(RECIPES_FILE) if os.path.exists(RECIPES_FILE) else {}
+
+def build_bom(recipes=RECIPES):
+    bom = np.zeros((len(SKUS), len(STOCK_ITEMS)))
+    for label, items in recipes.items():
+        for item, qty in items.items():
+            bom[SKU_BY_LABEL[label].index, STOCK_INDEX[item]] = qty
+    return bom
+
+BOM = build_bom()
+
+def usage(counts):
+    # counts: units sold per SKU, in SKUS order (e.g. a day's counter row)
+    return np.asarray(counts, dtype=float) @ BOM
@@ -0,0 +1,118 @@
+import contextvars
+import math
+import time
+from concurrent.futures import wait
+from typing import NamedTuple, Optional
+
+import gspread
+import numpy as np
+import pandas as pd
+
+from sales_store import to_number
+from sheets_scheduler import REFRESH, RateLimited, sheets_lane
+from sku_catalog import build_catalog
+from store_config import counter_range
+
+# --- Consolidated Branch Dashboard ---
+# Every branch's counter row for one day, fetched concurrently on a
+# bounded pool. Each branch gets BRANCH_TIMEOUT seconds from the moment
+# a worker picks it up; a slow, failing or rate-limited branch is
+# reported as such and never holds up the others.
+BRANCH_TIMEOUT = 8  # seconds
+MAX_WORKERS = 4
+POLL_INTERVAL = 0.05  # seconds between timeout checks
+
+class BranchResult(NamedTuple):
+    branch: object  # store_config.Branch
+    status: str     # ok, no sheet, timeout, rate limited, error
+    counts: Optional[tuple]
+    seconds: float
+    error: str = ""
+
+def daily_counter_range(branch, day):
+    title = f"{branch.sheet_name}_{day}".replace("'", "''")
+    return f"'{title}'!{counter_range(branch.cell_map)}"
+
+def fetch_counts(spreadsheet, branch, day):
+    # One values:batchGet by A1 name, so no worksheet metadata is fetched
+    value_range = spreadsheet.values_batch_get([daily_counter_range(branch, day)])["valueRanges"][0]
+    values = value_range.get("values", [])
+    row = values[0] if values else []
+    cells = len(build_catalog(branch.cell_map, branch.price_map))
+    return tuple(int(to_number(row[i])) if i < len(row) else 0 for i in range(cells))
+
+def fetch_all(branches, load, executor, timeout=BRANCH_TIMEOUT, workers=MAX_WORKERS):
+    # load(branch) returns the branch's counts; results come back in branch order
+    started = {}
+    def run(branch):
+        started[branch.key] = time.monotonic()
+        with sheets_lane(REFRESH):
+            return load(branch)
+
+    submitted = time.monotonic()
+    # Workers run in the caller's context, so a script run's calls still
+    # fail fast on a 429 and are counted against its section
+    futures = {executor.submit(contextvars.copy_context().run, run, branch): branch for branch in branches}
+    # Branches still queued behind hung ones give up after this
+    overall = submitted + timeout * math.ceil(len(branches) / workers)
+    results = {}
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=POLL_INTERVAL)
+        for future in done:
+            branch = futures[future]
+            seconds = time.monotonic() - started.get(branch.key, submitted)
+            try:
+                results[branch.key] = BranchResult(branch, "ok", future.result(), seconds)
+            except RateLimited as e:
+                results[branch.key] = BranchResult(branch, "rate limited", None, seconds, str(e))
+            except Exception as e:
+                # The day's tab not being there yet reads as a 400 on the range
+                if isinstance(e, gspread.exceptions.APIError) and "Unable to parse range" in str(e):
+                    results[branch.key] = BranchResult(branch, "no sheet", None, seconds, "No sheet for this day yet")
+                else:
+                    results[branch.key] = BranchResult(branch, "error", None, seconds, str(e))
+        now = time.monotonic()
+        for future in list(pending):
+            branch = futures[future]
+            began = started.get(branch.key)
+            if (began is not None and now - began > timeout) or now > overall:
+                # Left to finish on its own; its result is ignored
+                future.cancel()
+                pending.discard(future)
+                results[branch.key] = BranchResult(branch, "timeout", None, now - (began or now), f"No answer within {timeout}s")
+    return [results[branch.key] for branch in branches]
+
+# --- Tables ---
+def branch_table(results):
+    rows = []
+    for result in results:
+        total = None
+        sold = None
+        if result.counts is not None:
+            prices = np.array([sku.price for sku in build_catalog(result.branch.cell_map, result.branch.price_map)])
+            total = int(np.dot(np.asarray(result.counts), prices))
+            sold = int(sum(result.counts))
+        rows.append({
+            "Branch": result.branch.name,
+            "Status": result.status,
+            "Total Sales": total,
+            "Items Sold": sold,
+            "Seconds": round(result.seconds, 2),
+            "Note": result.error,
+        })
+    return pd.DataFrame(rows)
+
+def product_table(results):
+    # Quantity per item label and branch, plus a combined column
+    columns = {}
+    for result in results:
+        if result.counts is None:
+            continue
+        skus = build_catalog(result.branch.cell_map, result.branch.price_map)
+        columns[result.branch.name] = pd.Series(result.counts, index=[sku.label for sku in skus])
+    if not columns:
+        return pd.DataFrame()
+    table = pd.DataFrame(columns).fillna(0).astype(int)
+    table["All Branches"] = table.sum(axis=1)
+    return table.rename_axis("Item").reset_index()
@@ -0,0 +1,115 @@
+import argparse
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import gspread
+
+from sheets_client import SheetsConnection, load_credentials
+from sheets_scheduler import BACKGROUND, sheets_lane
+from store_config import (
+    SHEET_NAME, SALESLOG_NAME, SPREADSHEET_ID, COUNTER_RANGE, COUNTER_CELLS, manila_now
+)
+
+# --- Daily Sheet Rollover ---
+# Creates each day's MighteeMart1_YYYY-MM-DD / SalesLog_YYYY-MM-DD pair
+# ahead of time, so the first cashier of the day doesn't pay for it.
+SALESLOG_CLEAR_RANGE = "A2:H"  # everything below the header, open-ended
+CHECK_INTERVAL = 30 * 60  # seconds between scheduler checks
+
+log = logging.getLogger(__name__)
+
+# Serializes creation inside one server process; across processes the
+# Sheets "already exists" error tells the loser to use the winner's sheet.
+_rollover_lock = threading.Lock()
+
+def daily_titles(day):
+    return f"{SHEET_NAME}_{day}", f"{SALESLOG_NAME}_{day}"
+
+def manila_day(offset_days=0):
+    return (manila_now() + timedelta(days=offset_days)).strftime("%Y-%m-%d")
+
+def duplicate_or_get(spreadsheet, source, title):
+    # Returns (worksheet, created)
+    try:
+        ws = spreadsheet.duplicate_sheet(
+            source_sheet_id=source.id,
+            insert_sheet_index=None,
+            new_sheet_name=title
+        )
+        return ws, True
+    except gspread.exceptions.APIError as e:
+        if "already exists" not in str(e):
+            raise
+        return spreadsheet.worksheet(title), False
+
+def ensure_daily_sheets(spreadsheet, day):
+    inventory_title, saleslog_title = daily_titles(day)
+    with _rollover_lock:
+        # One metadata fetch gives us every worksheet handle
+        worksheets = {ws.title: ws for ws in spreadsheet.worksheets()}
+        if inventory_title not in worksheets:
+            # Copy structure from the template, then zero every counter in one write
+            ws, created = duplicate_or_get(spreadsheet, worksheets[SHEET_NAME], inventory_title)
+            if created:
+                ws.batch_update([{"range": COUNTER_RANGE, "values": [[0] * len(COUNTER_CELLS)]}])
+            worksheets[inventory_title] = ws
+        if saleslog_title not in worksheets:
+            # Keep the header row, clear the copied rows without downloading them
+            ws_log, created = duplicate_or_get(spreadsheet, worksheets[SALESLOG_NAME], saleslog_title)
+            if created:
+                ws_log.batch_clear([SALESLOG_CLEAR_RANGE])
+            worksheets[saleslog_title] = ws_log
+    return worksheets[inventory_title], worksheets[saleslog_title]
+
+def find_daily_sheets(spreadsheet, day):
+    # Existing tabs only: a day that has been archived is not brought back
+    inventory_title, saleslog_title = daily_titles(day)
+    worksheets = {ws.title: ws for ws in spreadsheet.worksheets()}
+    for title in (inventory_title, saleslog_title):
+        if title not in worksheets:
+            raise gspread.exceptions.WorksheetNotFound(f"{title} no longer exists (archived or deleted)")
+    return worksheets[inventory_title], worksheets[saleslog_title]
+
+# --- Scheduled Pre-creation ---
+class RolloverScheduler(threading.Thread):
+    # Keeps today's and tomorrow's sheets in place for a running server
+    def __init__(self, get_spreadsheet, interval=CHECK_INTERVAL, days_ahead=1):
+        super().__init__(name="daily-rollover", daemon=True)
+        self.get_spreadsheet = get_spreadsheet
+        self.interval = interval
+        self.days_ahead = days_ahead
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                with sheets_lane(BACKGROUND):
+                    for offset in range(self.days_ahead + 1):
+                        ensure_daily_sheets(self.get_spreadsheet(), manila_day(offset))
+            except Exception:
+                log.exception("Daily sheet pre-creation failed; retrying in %ss", self.interval)
+            self._stopped.wait(self.interval)
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-create the daily inventory and sales log sheets.")
+    parser.add_argument("--date", help="YYYY-MM-DD to prepare (default: tomorrow in Asia/Manila)")
+    parser.add_argument("--days", type=int, default=1, help="number of consecutive days to prepare")
+    args = parser.parse_args(argv)
+    connection = SheetsConnection(load_credentials(), SPREADSHEET_ID)
+    if args.date:
+        start = datetime.strptime(args.date, "%Y-%m-%d")
+        days = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(args.days)]
+    else:
+        days = [manila_day(i) for i in range(1, args.days + 1)]
+    with sheets_lane(BACKGROUND):
+        for day in days:
+            inventory_ws, saleslog_ws = ensure_daily_sheets(connection.spreadsheet(), day)
+            print(f"Ready: {inventory_ws.title}, {saleslog_ws.title}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+import json
+import random
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+import gspread
+import requests
+from gspread.cell import Cell
+from gspread.utils import a1_range_to_grid_range, a1_to_rowcol
+from gspread.worksheet import ValueRange
+
+# --- In-Memory Google Sheets Stand-in ---
+# Enough of the gspread Client / Spreadsheet / Worksheet API for this app
+# to run without the network: values live in dicts, every call is counted,
+# and latency and 429s can be injected. When the client is built through
+# SheetsConnection, calls go through its RequestScheduler like real ones.
+
+READ_METHODS = {
+    "open_by_key", "worksheets", "worksheet", "acell", "get", "batch_get", "col_values", "get_all_values", "values_batch_get"
+}
+
+def api_error(code, message, status):
+    response = requests.Response()
+    response.status_code = code
+    response._content = json.dumps({"error": {"code": code, "message": message, "status": status}}).encode()
+    return gspread.exceptions.APIError(response)
+
+def grid(range_name):
+    # 1-based inclusive bounds; open ends stay None
+    g = a1_range_to_grid_range(range_name)
+    first_row = g.get("startRowIndex", 0) + 1
+    first_col = g.get("startColumnIndex", 0) + 1
+    last_row = g.get("endRowIndex")
+    last_col = g.get("endColumnIndex")
+    return first_row, first_col, last_row, last_col
+
+def split_a1(name):
+    # "'Tom''s Sheet'!A1:B2" -> ("Tom's Sheet", "A1:B2")
+    title, range_name = name.rsplit("!", 1)
+    if title.startswith("'"):
+        title = title[1:-1].replace("''", "'")
+    return title, range_name
+
+class FakeBackend:
+    # Shared by every handle of one fake spreadsheet: counters, latency, faults
+    def __init__(self, latency=0.0, throttle_rate=0.0, seed=None):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.scheduler = None
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._throttle_next = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls = Counter()
+            self.throttled = 0
+            self.last_call_at = time.monotonic()
+
+    def seed(self, seed):
+        self._random.seed(seed)
+
+    def throttle_next(self, count=1):
+        with self._lock:
+            self._throttle_next += count
+
+    def stats(self):
+        with self._lock:
+            reads = sum(n for method, n in self.calls.items() if method in READ_METHODS)
+            return {
+                "reads": reads,
+                "writes": sum(self.calls.values()) - reads,
+                "throttled": self.throttled,
+                "calls": dict(self.calls),
+            }
+
+    def idle_for(self):
+        with self._lock:
+            return time.monotonic() - self.last_call_at
+
+    def _send(self, method, call):
+        with self._lock:
+            self.calls[method] += 1
+            self.last_call_at = time.monotonic()
+            throttle = self._throttle_next > 0 or (self.throttle_rate and self._random.random() < self.throttle_rate)
+            if self._throttle_next > 0:
+                self._throttle_next -= 1
+            if throttle:
+                self.throttled += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if throttle:
+            raise api_error(429, "Quota exceeded for quota metric 'Read requests'", "RESOURCE_EXHAUSTED")
+        return call()
+
+    def request(self, method, call, key=None):
+        send = lambda: self._send(method, call)
+        if self.scheduler is None:
+            return send()
+        if method in READ_METHODS:
+            return self.scheduler.submit("read", send, key=key)
+        return self.scheduler.submit("write", send)
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, sheet_id, title, cells=None):
+        self.spreadsheet = spreadsheet
+        self.id = sheet_id
+        self.title = title
+        self._cells = dict(cells or {})  # (row, col) -> str, 1-based
+
+    def __repr__(self):
+        return f"<FakeWorksheet {self.title!r} id:{self.id}>"
+
+    def _request(self, method, call, *args):
+        key = f"{self.title}:{method}:{args!r}" if method in READ_METHODS else None
+        return self.spreadsheet.backend.request(method, call, key)
+
+    # --- Value helpers (caller holds the spreadsheet lock) ---
+    def _last_row(self):
+        return max((row for (row, _), value in self._cells.items() if value != ""), default=0)
+
+    def _last_col(self):
+        return max((col for (_, col), value in self._cells.items() if value != ""), default=0)
+
+    def _read(self, range_name):
+        first_row, first_col, last_row, last_col = grid(range_name)
+        last_row = min(last_row or self._last_row(), self._last_row())
+        last_col = min(last_col or self._last_col(), self._last_col())
+        rows = []
+        for row in range(first_row, last_row + 1):
+            values = [self._cells.get((row, col), "") for col in range(first_col, last_col + 1)]
+            # The API trims trailing blanks from each row and trailing empty rows
+            while values and values[-1] == "":
+                values.pop()
+            rows.append(values)
+        while rows and not rows[-1]:
+            rows.pop()
+        return ValueRange.from_json({"range": f"'{self.title}'!{range_name}", "majorDimension": "ROWS", "values": rows})
+
+    def _write(self, range_name, values):
+        first_row, first_col, _, _ = grid(range_name)
+        for i, row in enumerate(values):
+            for j, value in enumerate(row):
+                self._cells[(first_row + i, first_col + j)] = "" if value is None else str(value)
+
+    def _clear(self, range_name):
+        first_row, first_col, last_row, last_col = grid(range_name)
+        for row, col in list(self._cells):
+            if row >= first_row and col >= first_col and (last_row is None or row <= last_row) and (last_col is None or col <= last_col):
+                del self._cells[(row, col)]
+
+    def _append(self, rows):
+        start = self._last_row() + 1
+        for i, row in enumerate(rows):
+            for j, value in enumerate(row):
+                self._cells[(start + i, j + 1)] = "" if value is None else str(value)
+
+    def _locked(self, fn, *args):
+        with self.spreadsheet.lock:
+            return fn(*args)
+
+    def values(self, range_name):
+        # Direct read for harness assertions; not counted as an API call
+        return list(self._locked(self._read, range_name))
+
+    # --- gspread Worksheet API ---
+    def acell(self, label, **kwargs):
+        def call():
+            row, col = a1_to_rowcol(label)
+            with self.spreadsheet.lock:
+                value = self._cells.get((row, col), "")
+            return Cell(row, col, value or None)
+        return self._request("acell", call, label)
+
+    def update_acell(self, label, value):
+        return self._request("update_acell", lambda: self._locked(self._write, label, [[value]]))
+
+    def get(self, range_name=None, **kwargs):
+        range_name = range_name or "A1:ZZ"
+        return self._request("get", lambda: self._locked(self._read, range_name), range_name)
+
+    def batch_get(self, ranges, **kwargs):
+        ranges = list(ranges)
+        return self._request("batch_get", lambda: [self._locked(self._read, r) for r in ranges], ranges)
+
+    def get_all_values(self, **kwargs):
+        return self._request("get_all_values", lambda: list(self._locked(self._read, "A1:ZZ")))
+
+    def col_values(self, col, **kwargs):
+        def call():
+            with self.spreadsheet.lock:
+                return [self._cells.get((row, col), "") for row in range(1, self._last_row() + 1)]
+        return self._request("col_values", call, col)
+
+    def update(self, values=None, range_name=None, **kwargs):
+        if isinstance(values, str) and not isinstance(range_name, str):
+            # Legacy gspread 5 argument order: update(range_name, values)
+            values, range_name = range_name, values
+        range_name = range_name or "A1"
+        return self._request("update", lambda: self._locked(self._write, range_name, values))
+
+    def batch_update(self, data, **kwargs):
+        def call():
+            with self.spreadsheet.lock:
+                for item in data:
+                    self._write(item["range"], item["values"])
+        return self._request("batch_update", call)
+
+    def batch_clear(self, ranges):
+        def call():
+            with self.spreadsheet.lock:
+                for range_name in ranges:
+                    self._clear(range_name)
+        return self._request("batch_clear", call)
+
+    def append_row(self, values, **kwargs):
+        return self._request("append_row", lambda: self._locked(self._append, [values]))
+
+    def append_rows(self, values, **kwargs):
+        return self._request("append_rows", lambda: self._locked(self._append, values))
+
+class FakeSpreadsheet:
+    def __init__(self, backend=None, spreadsheet_id="fake-spreadsheet"):
+        self.backend = backend or FakeBackend()
+        self.id = spreadsheet_id
+        self.lock = threading.RLock()
+        self._sheets = []
+        self._next_id = 1
+
+    def seed_worksheet(self, title, cells=None):
+        # Test setup only; not counted as an API call
+        with self.lock:
+            ws = FakeWorksheet(self, self._next_id, title, cells)
+            self._next_id += 1
+            self._sheets.append(ws)
+            return ws
+
+    def find(self, title):
+        with self.lock:
+            return next((ws for ws in self._sheets if ws.title == title), None)
+
+    def worksheets(self, **kwargs):
+        return self.backend.request("worksheets", lambda: self._locked_list(), f"{self.id}:worksheets")
+
+    def _locked_list(self):
+        with self.lock:
+            return list(self._sheets)
+
+    def worksheet(self, title):
+        def call():
+            ws = self.find(title)
+            if ws is None:
+                raise gspread.exceptions.WorksheetNotFound(title)
+            return ws
+        return self.backend.request("worksheet", call, f"{self.id}:worksheet:{title}")
+
+    def duplicate_sheet(self, source_sheet_id, insert_sheet_index=None, new_sheet_id=None, new_sheet_name=None):
+        def call():
+            with self.lock:
+                if self.find(new_sheet_name) is not None:
+                    raise api_error(
+                        400,
+                        f'Invalid requests[0].duplicateSheet: A sheet with the name "{new_sheet_name}" already exists. '
+                        "Please enter another name.",
+                        "INVALID_ARGUMENT"
+                    )
+                source = next(ws for ws in self._sheets if ws.id == source_sheet_id)
+                return self.seed_worksheet(new_sheet_name, source._cells)
+        return self.backend.request("duplicate_sheet", call)
+
+    def add_worksheet(self, title, rows, cols, index=None):
+        def call():
+            with self.lock:
+                if self.find(title) is not None:
+                    raise api_error(400, f'A sheet with the name "{title}" already exists.', "INVALID_ARGUMENT")
+                return self.seed_worksheet(title)
+        return self.backend.request("add_worksheet", call)
+
+    def values_batch_get(self, ranges, params=None):
+        def call():
+            value_ranges = []
+            with self.lock:
+                for name in ranges:
+                    title, range_name = split_a1(name)
+                    ws = self.find(title)
+                    if ws is None:
+                        raise api_error(400, f"Unable to parse range: {name}", "INVALID_ARGUMENT")
+                    value_range = {"range": name, "majorDimension": "ROWS"}
+                    values = list(ws._read(range_name))
+                    if values:
+                        # The API leaves "values" out for an empty range
+                        value_range["values"] = values
+                    value_ranges.append(value_range)
+            return {"spreadsheetId": self.id, "valueRanges": value_ranges}
+        return self.backend.request("values_batch_get", call, f"{self.id}:values_batch_get:{list(ranges)!r}")
+
+    def batch_update(self, body):
+        # Only deleteSheet requests are supported
+        def call():
+            with self.lock:
+                ids = {request["deleteSheet"]["sheetId"] for request in body["requests"]}
+                missing = ids - {ws.id for ws in self._sheets}
+                if missing:
+                    raise api_error(400, f"No sheet with id: {min(missing)}", "INVALID_ARGUMENT")
+                self._sheets = [ws for ws in self._sheets if ws.id not in ids]
+            return {"spreadsheetId": self.id, "replies": [{} for _ in body["requests"]]}
+        return self.backend.request("batch_update_spreadsheet", call)
+
+class FakeClient:
+    def __init__(self, spreadsheet, auth=None, session=None, http_client=None, others=None):
+        self.spreadsheet = spreadsheet
+        self.others = others or {}  # other spreadsheet IDs, e.g. for more branches
+        if http_client is not None:
+            # Same construction as gspread.Client; its scheduler, if any, paces our calls
+            scheduler = getattr(http_client(auth, session), "scheduler", None)
+            for fake in [spreadsheet, *self.others.values()]:
+                fake.backend.scheduler = scheduler
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+
+    def open_by_key(self, key):
+        spreadsheet = self.others.get(key, self.spreadsheet)
+        return spreadsheet.backend.request("open_by_key", lambda: spreadsheet, f"open_by_key:{key}")
+
+class FakeCredentials:
+    valid = True
+    token = "fake-token"
+    expiry = datetime(2100, 1, 1)
+
+    def refresh(self, request):
+        pass
+
+    def before_request(self, request, method, url, headers):
+        headers["authorization"] = f"Bearer {self.token}"
+
+@contextmanager
+def installed(spreadsheet, others=None):
+    # Point sheets_client at the fake: SheetsConnection(load_credentials(), ...)
+    # then builds a FakeClient with its real scheduler. others maps further
+    # spreadsheet IDs to their own fakes; any other ID opens spreadsheet.
+    import sheets_client
+    original_authorize = gspread.authorize
+    original_load = sheets_client.load_credentials
+    gspread.authorize = lambda credentials, http_client=None, session=None: FakeClient(
+        spreadsheet, credentials, session, http_client, others
+    )
+    sheets_client.load_credentials = FakeCredentials
+    try:
+        yield spreadsheet
+    finally:
+        gspread.authorize = original_authorize
+        sheets_client.load_credentials = original_load
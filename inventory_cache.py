@@ -0,0 +1,78 @@
+import threading
+import time
+from typing import NamedTuple
+
+from metrics import METRICS
+
+# --- Versioned Inventory Cache ---
+# Process-wide values keyed by (region, day), e.g. ("counters", "2024-05-01").
+# Writers put the value they wrote into the cache instead of clearing
+# it, so a write never costs a follow-up read. The TTL only exists to
+# pick up edits made directly in the spreadsheet.
+INVENTORY_TTL = 60  # seconds
+
+class CacheEntry(NamedTuple):
+    value: object
+    version: int
+    loaded_at: float
+
+class InventoryCache:
+    def __init__(self, ttl=INVENTORY_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._versions = {}
+
+    def _store(self, key, value):
+        # Caller holds the lock
+        version = self._versions.get(key, 0) + 1
+        self._versions[key] = version
+        self._entries[key] = CacheEntry(value, version, time.monotonic())
+        return version
+
+    def get(self, key, load):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry.loaded_at < self.ttl:
+                METRICS.inc("inventory_cache_requests_total", region=key[0], result="hit")
+                return entry.value
+        METRICS.inc("inventory_cache_requests_total", region=key[0], result="miss" if entry is None else "expired")
+        # Load outside the lock so one slow read doesn't block other keys
+        value = load()
+        with self._lock:
+            self._store(key, value)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            return self._store(key, value)
+
+    def offer(self, key, value, seen_version):
+        # Publish a background read unless a writer got in after seen_version
+        # was taken; an unchanged value only renews the TTL. True if published.
+        with self._lock:
+            if self._versions.get(key, 0) != seen_version:
+                return False
+            entry = self._entries.get(key)
+            if entry is not None and entry.value == value:
+                self._entries[key] = entry._replace(loaded_at=time.monotonic())
+                return False
+            self._store(key, value)
+            return True
+
+    def versions(self):
+        with self._lock:
+            return dict(self._versions)
+
+    def peek(self, key):
+        # Last known value even if expired, for when a reload isn't possible
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.value if entry is not None else None
+
+    def invalidate(self, key):
+        # Expire rather than drop, so peek() can still fall back to it
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries[key] = entry._replace(loaded_at=float("-inf"))
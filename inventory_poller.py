@@ -0,0 +1,54 @@
+import logging
+import threading
+
+from metrics import METRICS
+from sheets_scheduler import BACKGROUND, sheets_lane
+
+# --- Shared Change-Detection Poller ---
+# One per server process: a cheap batched read of the live ranges,
+# offered to the InventoryCache so every open session sees edits made
+# on other terminals or directly in the spreadsheet. Sessions only read
+# the cache, so polling costs one request per interval per process no
+# matter how many phones are open.
+MIN_INTERVAL = 5    # seconds, right after a change
+MAX_INTERVAL = 30   # seconds, when nothing changes; below INVENTORY_TTL
+BACKOFF = 1.5       # interval growth per unchanged poll
+
+log = logging.getLogger(__name__)
+
+class InventoryPoller(threading.Thread):
+    # read() returns {cache key: value} for the current day's ranges
+    def __init__(self, read, cache, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+        super().__init__(name="inventory-poller", daemon=True)
+        self.read = read
+        self.cache = cache
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self._stopped = threading.Event()
+        METRICS.register_gauge("inventory_poll_interval_seconds", lambda: self.interval)
+
+    def stop(self):
+        self._stopped.set()
+
+    def poll(self):
+        # Versions are taken before the read, so a write-through that lands
+        # while the read is in flight wins over the older poll result
+        seen = self.cache.versions()
+        with sheets_lane(BACKGROUND):
+            values = self.read()
+        return [key for key, value in values.items() if self.cache.offer(key, value, seen.get(key, 0))]
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                changed = self.poll()
+            except Exception:
+                log.exception("Inventory poll failed")
+                METRICS.inc("inventory_polls_total", result="error")
+                self.interval = self.max_interval
+            else:
+                METRICS.inc("inventory_polls_total", result="changed" if changed else "unchanged")
+                # Poll fast while things are moving, drift back when quiet
+                self.interval = self.min_interval if changed else min(self.max_interval, self.interval * BACKOFF)
+            self._stopped.wait(self.interval)
@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from benchmark import (
+    APP_PATH, add_item, check, checkout, open_tab, settle, stop_background_threads, template_spreadsheet
+)
+from daily_rollover import daily_titles
+from fake_sheets import FakeBackend, installed
+from order_journal import OrderJournal
+from sku_catalog import SKUS, find_sku
+from store_config import COUNTER_CELLS, COUNTER_RANGE, manila_now
+
+# --- Multi-Session Load / Soak Test ---
+# N simulated cashier sessions share one app process and one fake
+# spreadsheet, replaying a lunch-peak order mix. AppTest keeps a single
+# process-wide runtime, so the sessions' script runs are interleaved
+# round-robin; the journal flusher, rollover thread and request
+# scheduler still run concurrently with them, as on the server.
+DEFAULT_LATENCY = 0.15  # seconds per fake Sheets request
+PRODUCT_WEIGHTS = {"Buko Juice": 5, "Buko Shake": 4, "Pizza": 1}
+ITEMS_PER_ORDER = {1: 6, 2: 3, 3: 1}  # distinct SKUs in a cart -> weight
+QTY_WEIGHTS = {1: 7, 2: 2, 3: 1}
+ACTION_WEIGHTS = {"order": 85, "remove": 5, "summary": 10}
+
+def weighted(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+def deep_size(obj, seen=None):
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    return size
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"count": len(samples), "p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3)}
+
+# --- Simulated cashier ---
+class Session:
+    def __init__(self, index, rng):
+        self.index = index
+        self.rng = rng
+        self.at = AppTest.from_file(APP_PATH, default_timeout=120)
+        self.tab = "Facebuko Sales"
+        check(self.at.run())
+
+    def show(self, tab):
+        if self.tab != tab:
+            open_tab(self.at, tab)
+            self.tab = tab
+
+    def place_order(self, tally):
+        self.show("Facebuko Sales")
+        products = self.rng.choices(list(PRODUCT_WEIGHTS), weights=list(PRODUCT_WEIGHTS.values()), k=weighted(self.rng, ITEMS_PER_ORDER))
+        cart = Counter()
+        for product in products:
+            sku = self.rng.choice([sku for sku in SKUS if sku.product == product])
+            qty = weighted(self.rng, QTY_WEIGHTS)
+            add_item(self.at, sku.product, sku.packaging, sku.size, qty)
+            cart[sku.cell] += qty
+        checkout(self.at)
+        # Counted only once the order is journaled
+        tally["placed"].update(cart)
+        tally["orders"] += 1
+
+    def remove_item(self, tally):
+        # Only ever remove what was sold, so counters never hit the zero floor
+        on_hand = [cell for cell in tally["placed"] if tally["placed"][cell] > tally["removed"][cell]]
+        self.show("Remove Order")
+        if not on_hand:
+            return False
+        sku = SKUS[COUNTER_CELLS.index(self.rng.choice(on_hand))]
+        check(self.at.selectbox(key="remove_product").set_value(sku.product).run())
+        if sku.product == "Pizza":
+            self.at.selectbox(key="remove_pizza_type").set_value(sku.size)
+        else:
+            self.at.selectbox(key="remove_packaging").set_value(sku.packaging)
+            self.at.selectbox(key="remove_size").set_value(sku.size)
+        self.at.number_input(key="remove_qty").set_value(1)
+        check(self.at.button(key="remove_order_btn").click().run())
+        tally["removed"][sku.cell] += 1
+        return True
+
+    def view_summary(self, tally):
+        self.show("Sales Summary")
+        check(self.at.run())
+
+    def step(self, tally, latencies):
+        action = weighted(self.rng, ACTION_WEIGHTS)
+        started = time.perf_counter()
+        if action == "remove" and not self.remove_item(tally):
+            return
+        if action == "order":
+            self.place_order(tally)
+        elif action == "summary":
+            self.view_summary(tally)
+        latencies[action].append(time.perf_counter() - started)
+
+    def state_size(self):
+        return deep_size(self.at.session_state.to_dict())
+
+# --- Consistency ---
+def check_counters(spreadsheet, day, tally):
+    inventory_title, saleslog_title = daily_titles(day)
+    row = spreadsheet.find(inventory_title).values(COUNTER_RANGE)
+    row = row[0] if row else []
+    counters = {cell: int(row[i]) if i < len(row) and row[i] else 0 for i, cell in enumerate(COUNTER_CELLS)}
+    # Sales are positive log rows; removals are logged as negative rows
+    sold, returned = Counter(), Counter()
+    order_ids = set()
+    for date, _, product, packaging, size, qty, _, order_id in spreadsheet.find(saleslog_title).values("A2:H"):
+        cell = find_sku(product, packaging, size).cell
+        if int(qty) > 0:
+            sold[cell] += int(qty)
+            order_ids.add(order_id)
+        else:
+            returned[cell] -= int(qty)
+    problems = []
+    if len(order_ids) != tally["orders"]:
+        problems.append(f"{tally['orders']} orders placed but {len(order_ids)} logged")
+    for cell in COUNTER_CELLS:
+        if sold[cell] != tally["placed"][cell]:
+            problems.append(f"{cell}: placed {tally['placed'][cell]}, logged {sold[cell]}")
+        if returned[cell] != tally["removed"][cell]:
+            problems.append(f"{cell}: removed {tally['removed'][cell]}, logged {returned[cell]}")
+        if counters[cell] != sold[cell] - returned[cell]:
+            problems.append(f"{cell}: counter {counters[cell]}, net logged {sold[cell] - returned[cell]}")
+    return problems
+
+# --- Runner ---
+def run(sessions, orders, duration, latency, throttle_rate, seed, workdir):
+    stop_background_threads()
+    st.cache_resource.clear()
+    os.environ["ORDER_JOURNAL_PATH"] = os.path.join(workdir, "load_journal.db")
+    os.environ["SALES_STORE_PATH"] = os.path.join(workdir, "load_history.db")
+    # Polling is part of the per-process cost being measured
+    os.environ["INVENTORY_POLLER"] = "on"
+    journal = OrderJournal(os.environ["ORDER_JOURNAL_PATH"])
+    backend = FakeBackend(latency=latency, throttle_rate=throttle_rate, seed=seed)
+    spreadsheet = template_spreadsheet(backend)
+    tally = {"orders": 0, "placed": Counter(), "removed": Counter()}
+    latencies = defaultdict(list)
+    errors = Counter()
+    with installed(spreadsheet):
+        rng = random.Random(seed)
+        # Measure growth from after the first session, once imports and the runtime are warm
+        cashiers = [Session(0, random.Random(rng.random()))]
+        rss_warm = peak_rss_kb()
+        cashiers += [Session(i, random.Random(rng.random())) for i in range(1, sessions)]
+        started = time.monotonic()
+        deadline = started + duration if duration else None
+        while (tally["orders"] < orders) if deadline is None else (time.monotonic() < deadline):
+            for cashier in cashiers:
+                try:
+                    cashier.step(tally, latencies)
+                except Exception as e:
+                    errors[str(e)[:120]] += 1
+                    # A failed run leaves the page in an unknown state; start over
+                    cashier.at = AppTest.from_file(APP_PATH, default_timeout=120)
+                    cashier.tab = "Facebuko Sales"
+                    check(cashier.at.run())
+        elapsed = time.monotonic() - started
+        settle(backend, journal)
+        drained = time.monotonic() - started
+        state_sizes = [cashier.state_size() for cashier in cashiers]
+    stop_background_threads()
+    calls = backend.stats()
+    return {
+        "sessions": sessions,
+        "orders": tally["orders"],
+        "elapsed_seconds": round(elapsed, 2),
+        "drained_seconds": round(drained, 2),
+        "orders_per_second": round(tally["orders"] / elapsed, 2),
+        "latency_seconds": {action: percentiles(samples) for action, samples in sorted(latencies.items())},
+        "all_actions_seconds": percentiles([s for samples in latencies.values() for s in samples]),
+        "reads_per_order": round(calls["reads"] / max(1, tally["orders"]), 2),
+        "writes_per_order": round(calls["writes"] / max(1, tally["orders"]), 2),
+        "throttled": calls["throttled"],
+        "calls": calls["calls"],
+        "session_state_bytes": {"mean": int(np.mean(state_sizes)), "max": max(state_sizes)},
+        "peak_rss_growth_kb": peak_rss_kb() - rss_warm,
+        "errors": dict(errors),
+        "consistency_problems": check_counters(spreadsheet, manila_now().strftime("%Y-%m-%d"), tally),
+    }
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate concurrent cashier sessions against a fake spreadsheet.")
+    parser.add_argument("--sessions", type=int, default=5, help="number of simulated cashier sessions")
+    parser.add_argument("--orders", type=int, default=100, help="stop after this many orders")
+    parser.add_argument("--duration", type=float, help="soak: run for this many seconds instead of --orders")
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY, help="seconds added to every fake Sheets request")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered with a 429")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        report = run(args.sessions, args.orders, args.duration, args.latency, args.throttle_rate, args.seed, workdir)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['sessions']} sessions, {report['orders']} orders in {report['elapsed_seconds']}s "
+              f"({report['orders_per_second']} orders/s), journal drained at {report['drained_seconds']}s")
+        for action, stats in report["latency_seconds"].items():
+            print(f"  {action:<8} n={stats['count']:<5} p50={stats['p50']:.3f}s p95={stats['p95']:.3f}s p99={stats['p99']:.3f}s")
+        print(f"  Sheets requests per order: {report['reads_per_order']} reads, {report['writes_per_order']} writes "
+              f"({report['throttled']} answered 429)")
+        print(f"  session_state: mean {report['session_state_bytes']['mean']} B, max {report['session_state_bytes']['max']} B; "
+              f"peak RSS +{report['peak_rss_growth_kb']} KB after warm-up")
+        for error, count in report["errors"].items():
+            print(f"  error x{count}: {error}")
+        print("  counters consistent" if not report["consistency_problems"] else "  COUNTERS INCONSISTENT:")
+        for problem in report["consistency_problems"]:
+            print(f"    {problem}")
+    return 1 if report["errors"] or report["consistency_problems"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
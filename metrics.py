@@ -0,0 +1,251 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict, deque
+
+# --- In-Process Metrics ---
+# Counters and latency histograms for the hot path, shared by every
+# session and background thread. The admin Diagnostics tab reads them
+# directly; MetricsExporter writes them as Prometheus text, and each
+# finished rerun is logged as one JSON line on the "metrics" logger.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RECENT_SAMPLES = 500  # kept per series for percentiles on the Diagnostics tab
+EXPORT_INTERVAL = 15  # seconds between Prometheus file writes
+TIMER_KEY = "_rerun_timer"
+
+log = logging.getLogger("metrics")
+
+# Imported by the first script run of the process; cold start is measured from here
+PROCESS_STARTED = time.perf_counter()
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def percentile(self, q):
+        samples = sorted(self.recent)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q / 100 * len(samples)))]
+
+def label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{label_value(v)}"' for k, v in pairs) + "}"
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._gauges = {}
+        self.started_at = time.time()
+
+    def inc(self, name, amount=1, **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def register_gauge(self, name, read):
+        # read() is called whenever the metrics are rendered
+        with self._lock:
+            self._gauges[name] = read
+
+    # --- Reading ---
+    def counters(self, name):
+        with self._lock:
+            return [(dict(labels), value) for (n, labels), value in self._counters.items() if n == name]
+
+    def histograms(self, name):
+        with self._lock:
+            return [(dict(labels), h) for (n, labels), h in self._histograms.items() if n == name]
+
+    def gauges(self):
+        with self._lock:
+            gauges = dict(self._gauges)
+        values = {}
+        for name, read in gauges.items():
+            try:
+                values[name] = float(read())
+            except Exception:
+                log.exception("Gauge %s failed", name)
+        return values
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            histograms = [(key, list(h.buckets), h.count, h.sum) for key, h in histograms]
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{format_labels(labels)} {value:g}")
+        for (name, labels), buckets, count, total in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, n in zip(list(LATENCY_BUCKETS) + ["+Inf"], buckets):
+                cumulative += n
+                lines.append(f"{name}_bucket{format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        for name, value in sorted(self.gauges().items()):
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        # Atomic replace, so a scraper never reads a half-written file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+
+METRICS = Metrics()
+
+# --- Per-rerun timing ---
+_rerun = contextvars.ContextVar("rerun_timer", default=None)
+_cold_start_lock = threading.Lock()
+_cold_start_recorded = False
+
+def record_cold_start(metrics, interactive_at):
+    # Only the process's first session counts as a cold start
+    global _cold_start_recorded
+    with _cold_start_lock:
+        if _cold_start_recorded:
+            return
+        _cold_start_recorded = True
+    metrics.observe("app_cold_start_seconds", interactive_at - PROCESS_STARTED)
+
+class RerunTimer:
+    # Splits one script run into named sections and counts the Sheets
+    # requests made while each section was running.
+    def __init__(self, kind, metrics=METRICS):
+        self.kind = kind
+        self.tab = ""
+        self.metrics = metrics
+        self.started = time.perf_counter()
+        self.current = "setup"
+        self._section_started = self.started
+        self.sections = {}
+        self.calls = Counter()
+        self.interactive_at = None
+        self.finished = False
+
+    def section(self, name):
+        self._close_section()
+        self.current = name
+
+    def _close_section(self):
+        now = time.perf_counter()
+        self.sections[self.current] = self.sections.get(self.current, 0.0) + now - self._section_started
+        self._section_started = now
+
+    def count_call(self, bucket):
+        self.calls[(self.current, bucket)] += 1
+
+    def interactive(self):
+        # The page can be used from here on; the rest of the run fills in data.
+        # Runs that never call this are interactive once they finish.
+        if self.interactive_at is None:
+            self.interactive_at = time.perf_counter() - self.started
+
+    def finish(self, outcome="ok"):
+        if self.finished:
+            return
+        self._close_section()
+        self.finished = True
+        total = time.perf_counter() - self.started
+        for name, seconds in self.sections.items():
+            self.metrics.observe("app_section_seconds", seconds, kind=self.kind, section=name)
+        self.metrics.observe("app_rerun_seconds", total, kind=self.kind, tab=self.tab, outcome=outcome)
+        if outcome == "ok":
+            self.interactive()
+            self.metrics.observe("app_interactive_seconds", self.interactive_at, kind=self.kind, tab=self.tab)
+            if self.kind == "session_start":
+                record_cold_start(self.metrics, self.started + self.interactive_at)
+        log.info(json.dumps({
+            "event": "rerun",
+            "kind": self.kind,
+            "tab": self.tab,
+            "outcome": outcome,
+            "seconds": round(total, 4),
+            "interactive_seconds": round(self.interactive_at, 4) if self.interactive_at is not None else None,
+            "sections": {name: round(seconds, 4) for name, seconds in self.sections.items()},
+            "sheets_calls": {f"{section}:{bucket}": n for (section, bucket), n in self.calls.items()},
+        }))
+
+def start_rerun(state, kind="app"):
+    # st.rerun() and st.stop() end a run without reaching its finish();
+    # the next run closes that timer before starting its own.
+    previous = state.get(TIMER_KEY)
+    if previous is not None and not previous.finished:
+        previous.finish("interrupted")
+    if previous is None and kind == "app":
+        # A session's first run: what a cashier waits for after opening the page
+        kind = "session_start"
+    timer = RerunTimer(kind)
+    state[TIMER_KEY] = timer
+    _rerun.set(timer)
+    return timer
+
+def enter_fragment(state, name):
+    # Inside a full run the fragment is just another section; a
+    # fragment-only rerun gets a timer of its own, returned to finish.
+    timer = state.get(TIMER_KEY)
+    if timer is not None and not timer.finished:
+        timer.section(name)
+        return None
+    return start_rerun(state, name)
+
+def current_rerun():
+    timer = _rerun.get()
+    return timer if timer is not None and not timer.finished else None
+
+# --- Prometheus file export ---
+class MetricsExporter(threading.Thread):
+    def __init__(self, path, metrics=METRICS, interval=EXPORT_INTERVAL):
+        super().__init__(name="metrics-exporter", daemon=True)
+        self.path = path
+        self.metrics = metrics
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                self.metrics.write_prometheus(self.path)
+            except Exception:
+                log.exception("Writing %s failed", self.path)
+            self._stopped.wait(self.interval)
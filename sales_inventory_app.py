@@ -1,338 +1,718 @@
 import streamlit as st
 import gspread
-from google.oauth2.service_account import Credentials
+import logging
 import os
-import json
-import base64
 import pandas as pd
-from datetime import datetime
-import pytz
-
-# --- Google Sheets Setup ---
-SHEET_NAME = "MighteeMart1"
-SPREADSHEET_ID = "1rNAba2jqzBqzXZZxplfkXc5XthDbgVVvntDOIdDEx9w"
-
-# --- Decode base64 secret and authorize ---
-creds_b64 = os.environ["GOOGLE_SERVICE_ACCOUNT_B64"]
-creds_bytes = base64.b64decode(creds_b64)
-creds_dict = json.loads(creds_bytes.decode("utf-8"))
-
-scope = ["https://www.googleapis.com/auth/spreadsheets"]
-creds = Credentials.from_service_account_info(creds_dict, scopes=scope)
-client = gspread.authorize(creds)
-
-# --- Cell Map Matching Excel Structure ---
-cell_map = {
-    "Buko Juice": {
-        "Cup": {
-            "Small": "C6",
-            "Medium": "D6",
-            "Large": "E6"
-        },
-        "Bottle": {
-            "Small": "F6",
-            "Medium": "G6",
-            "Large": "H6"
-        }
-    },
-    "Buko Shake": {
-        "Cup": {
-            "Small": "I6",
-            "Medium": "J6",
-            "Large": "K6"
-        },
-        "Bottle": {
-            "Small": "L6",
-            "Medium": "M6",
-            "Large": "N6"
-        }
-    },
-    "Pizza": {
-        "Box": {
-            "Supreme": "O6",
-            "Hawaiian": "P6",
-            "Pepperoni": "Q6",
-            "Ham & Cheese": "R6",
-            "Shawarma": "S6"
-        }
-    }
-}
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import NamedTuple
+from bom import BOM, RECIPES_FILE, usage as stock_usage
+from inventory_cache import InventoryCache
+from inventory_poller import InventoryPoller
+from metrics import METRICS, MetricsExporter, enter_fragment, start_rerun
+from daily_rollover import RolloverScheduler, daily_titles, ensure_daily_sheets, find_daily_sheets, manila_day
+from order_journal import OrderJournal, JournalFlusher, Unsyncable, merge_deltas
+from sales_store import SalesStore
+from sheets_client import SheetsConnection, load_credentials
+from sheets_scheduler import BACKGROUND, COMMIT, REFRESH, RateLimited, sheets_lane
+from store_config import (
+    BRANCH, BRANCHES, SPREADSHEET_ID, COUNTER_RANGE, COUNTER_CELLS, SALESLOG_COLUMNS, STOCK_COLUMNS, STOCK_ITEMS, STOCK_RANGES,
+    STOCK_START_ROW, cell_map, manila_now
+)
+from sku_catalog import CELL_INDEX, SKUS, cart_vector, find_sku, sales_total
+
+# Times this script run section by section; finished at the end of the script
+rerun_timer = start_rerun(st.session_state)
+
+log = logging.getLogger(__name__)
 
-# --- Prices ---
-price_map = {
-    "Cup": {"Small": 65, "Medium": 75, "Large": 95},
-    "Bottle": {"Small": 65, "Medium": 75, "Large": 115},
-    "Box": {"Supreme": 250, "Others": 190}
-}
+# --- Shared, process-wide Sheets client ---
+# Built on first use, normally by the warm-up thread (see Startup below)
+@st.cache_resource(show_spinner=False)
+def get_sheets_connection():
+    return SheetsConnection(load_credentials(), SPREADSHEET_ID)
 
 # --- Daily Sheet Automation ---
-def get_daily_worksheets():
-    today_str = datetime.now(pytz.timezone("Asia/Manila")).strftime("%Y-%m-%d")
-    inventory_title = f"MighteeMart1_{today_str}"
-    saleslog_title = f"SalesLog_{today_str}"
-    spreadsheet = client.open_by_key(SPREADSHEET_ID)
-    # Check if sheets exist
-    sheet_titles = [ws.title for ws in spreadsheet.worksheets()]
-    # Inventory sheet
-    if inventory_title not in sheet_titles:
-        # Copy structure from original inventory sheet
-        new_sheet = spreadsheet.duplicate_sheet(
-            source_sheet_id=spreadsheet.worksheet(SHEET_NAME).id,
-            insert_sheet_index=None,
-            new_sheet_name=inventory_title
-        )
-        # Set all inventory cells to 0
-        ws = spreadsheet.worksheet(inventory_title)
-        # Buko Juice
-        for packaging in ["Cup", "Bottle"]:
-            for size in ["Small", "Medium", "Large"]:
-                ws.update_acell(cell_map["Buko Juice"][packaging][size], 0)
-        # Buko Shake
-        for packaging in ["Cup", "Bottle"]:
-            for size in ["Small", "Medium", "Large"]:
-                ws.update_acell(cell_map["Buko Shake"][packaging][size], 0)
-        # Pizza
-        for flavor in ["Supreme", "Hawaiian", "Pepperoni", "Ham & Cheese", "Shawarma"]:
-            ws.update_acell(cell_map["Pizza"]["Box"][flavor], 0)
-    # SalesLog sheet
-    if saleslog_title not in sheet_titles:
-        # Copy structure from original sales log sheet
-        spreadsheet.duplicate_sheet(
-            source_sheet_id=spreadsheet.worksheet("SalesLog").id,
-            insert_sheet_index=None,
-            new_sheet_name=saleslog_title
-        )
-        # Clear all rows except header in the new sales log sheet
-        ws_log = spreadsheet.worksheet(saleslog_title)
-        all_rows = ws_log.get_all_values()
-        if len(all_rows) > 1:
-            ws_log.batch_clear([f"A2:G{len(all_rows)}"])
-    # Return worksheet objects
-    inventory_ws = spreadsheet.worksheet(inventory_title)
-    saleslog_ws = spreadsheet.worksheet(saleslog_title)
-    return inventory_ws, saleslog_ws
+# Resolved once per Asia/Manila day and shared by every session; a new
+# date is a new cache key, so the rollover re-resolves on its own.
+# Normally the scheduler below has already created the day's sheets.
+# Older days (journal entries flushed late) are only looked up: their tabs
+# may have been archived, and recreating them would split the day's sales.
+def is_past_day(day):
+    return day < manila_day(-1)
+
+@st.cache_resource(show_spinner=False, max_entries=3)
+def get_daily_worksheets(today_str):
+    spreadsheet = get_sheets_connection().spreadsheet()
+    if is_past_day(today_str):
+        return find_daily_sheets(spreadsheet, today_str)
+    return ensure_daily_sheets(spreadsheet, today_str)
+
+@st.cache_resource(show_spinner=False)
+def start_rollover_scheduler():
+    scheduler = RolloverScheduler(get_sheets_connection().spreadsheet)
+    scheduler.start()
+    return scheduler
+
+# Set ARCHIVE_KEEP_DAYS to have days older than that archived and their
+# tabs deleted once a day (plus Parquet copies in ARCHIVE_PARQUET_DIR)
+ARCHIVE_KEEP_DAYS = int(os.environ.get("ARCHIVE_KEEP_DAYS") or 0)
+
+@st.cache_resource(show_spinner=False)
+def start_archive_scheduler():
+    if not ARCHIVE_KEEP_DAYS:
+        return None
+    # Only imported when archiving is switched on
+    from sheet_archive import ArchiveScheduler
+    scheduler = ArchiveScheduler(get_sheets_connection().spreadsheet, ARCHIVE_KEEP_DAYS, os.environ.get("ARCHIVE_PARQUET_DIR"))
+    scheduler.start()
+    return scheduler
+
+def is_missing_sheet_error(error):
+    # A daily tab deleted or renamed behind our back
+    if isinstance(error, gspread.exceptions.WorksheetNotFound):
+        return True
+    if isinstance(error, gspread.exceptions.APIError):
+        return error.code == 404 or "Unable to parse range" in str(error)
+    return False
+
+def forget_daily_worksheets():
+    get_daily_worksheets.clear()
+
+# --- Inventory Snapshot ---
+def to_count(value):
+    value = str(value).strip().replace(",", "") if value is not None else ""
+    return int(value) if value.isdigit() else 0
+
+class InventorySnapshot(NamedTuple):
+    sheet_title: str
+    counts: tuple  # one int per COUNTER_CELLS entry, in sheet order
+
+    def qty(self, cell):
+        return self.counts[CELL_INDEX[cell]]
+
+def snapshot_from_values(sheet_title, values):
+    row = values[0] if values else []
+    counts = tuple(
+        to_count(row[i]) if i < len(row) else 0
+        for i in range(len(COUNTER_CELLS))
+    )
+    return InventorySnapshot(sheet_title, counts)
+
+def load_inventory_snapshot(inventory_ws):
+    return snapshot_from_values(inventory_ws.title, inventory_ws.batch_get([COUNTER_RANGE])[0])
+
+# --- Stocks Table ---
+
+def build_stocks_table(beg_bal_range, qty_in_range, end_bal_range):
+    table_data = []
+    for i, stock in enumerate(STOCK_ITEMS):
+        beg_bal = beg_bal_range[i][0] if i < len(beg_bal_range) and beg_bal_range[i] else None
+        qty_in = qty_in_range[i][0] if i < len(qty_in_range) and qty_in_range[i] else None
+        end_bal = end_bal_range[i][0] if i < len(end_bal_range) and end_bal_range[i] else None
+        beg_bal = float(beg_bal) if beg_bal not in (None, "") else None
+        qty_in = float(qty_in) if qty_in not in (None, "") else None
+        end_bal = float(end_bal) if end_bal not in (None, "") else None
+        table_data.append({
+            "Stock": stock,
+            "Beg. Bal": beg_bal,
+            "Qty. In": qty_in,
+            "Ending Bal": end_bal
+        })
+    return table_data
 
 # --- Simplified Inventory Display ---
-@st.cache_data(show_spinner=False)
-def get_simple_inventory():
-    # Buko Juice
-    buko_juice_cup = [
-        int(inventory_ws.acell(cell_map["Buko Juice"]["Cup"][size]).value or 0)
-        for size in ["Small", "Medium", "Large"]
-    ]
-    buko_juice_bottle = [
-        int(inventory_ws.acell(cell_map["Buko Juice"]["Bottle"][size]).value or 0)
-        for size in ["Small", "Medium", "Large"]
-    ]
-    # Buko Shake
-    buko_shake_cup = [
-        int(inventory_ws.acell(cell_map["Buko Shake"]["Cup"][size]).value or 0)
-        for size in ["Small", "Medium", "Large"]
-    ]
-    buko_shake_bottle = [
-        int(inventory_ws.acell(cell_map["Buko Shake"]["Bottle"][size]).value or 0)
-        for size in ["Small", "Medium", "Large"]
-    ]
-    # Pizza
-    pizza_flavors = [
-        int(inventory_ws.acell(cell_map["Pizza"]["Box"][flavor]).value or 0)
-        for flavor in ["Supreme", "Hawaiian", "Pepperoni", "Ham & Cheese", "Shawarma"]
-    ]
+def get_simple_inventory(snapshot):
+    sizes = ["Small", "Medium", "Large"]
+    flavors = list(cell_map["Pizza"]["Box"])
     data = [
-        ["Buko Juice - Cup"] + buko_juice_cup,
-        ["Buko Juice - Bottle"] + buko_juice_bottle,
-        ["Buko Shake - Cup"] + buko_shake_cup,
-        ["Buko Shake - Bottle"] + buko_shake_bottle,
-        ["Pizza"] + pizza_flavors
+        [f"{product} - {packaging}"] + [snapshot.qty(cell_map[product][packaging][size]) for size in sizes]
+        for product in ["Buko Juice", "Buko Shake"]
+        for packaging in ["Cup", "Bottle"]
     ]
-    columns = [
-        "Product",
-        "Small", "Medium", "Large"
-    ]
-    pizza_columns = [
-        "Product",
-        "Supreme", "Hawaiian", "Pepperoni", "Ham & Cheese", "Shawarma"
-    ]
-    df1 = pd.DataFrame(data[:4], columns=columns)
-    df2 = pd.DataFrame([data[4]], columns=pizza_columns)
+    pizza_row = ["Pizza"] + [snapshot.qty(cell_map["Pizza"]["Box"][flavor]) for flavor in flavors]
+    df1 = pd.DataFrame(data, columns=["Product"] + sizes)
+    df2 = pd.DataFrame([pizza_row], columns=["Product"] + flavors)
     return df1, df2
 
+# --- Order Commit ---
+ORDER_ID_COL = 8
+
+def new_order_id():
+    return uuid.uuid4().hex[:12]
+
+def cart_deltas(cart):
+    return {SKUS[sku_index].cell: qty for sku_index, qty in cart.items()}
+
+def order_log_rows(cart, order_id, now):
+    rows = []
+    for sku_index, qty in cart.items():
+        sku = SKUS[sku_index]
+        rows.append([
+            now.strftime("%Y-%m-%d"),
+            now.strftime("%H:%M:%S"),
+            sku.product,
+            sku.packaging,
+            sku.size,
+            qty,
+            sku.price * qty,
+            order_id
+        ])
+    return rows
+
+def apply_deltas(snapshot, deltas):
+    counts = list(snapshot.counts)
+    for cell, delta in deltas.items():
+        i = CELL_INDEX[cell]
+        counts[i] = max(0, counts[i] + delta)
+    return InventorySnapshot(snapshot.sheet_title, tuple(counts))
+
+def build_order_commit(entries, snapshot):
+    deltas = merge_deltas(entry.deltas for entry in entries)
+    updated = apply_deltas(snapshot, deltas)
+    return {
+        "order_ids": [entry.order_id for entry in entries],
+        # The whole counter row as it will be after this commit
+        "snapshot": updated,
+        # Absolute counter values, so replaying the same commit is idempotent
+        "counters": {cell: updated.qty(cell) for cell in deltas},
+        "log_rows": [row for entry in entries for row in entry.log_rows]
+    }
+
+def apply_order_commit(inventory_ws, saleslog_ws, commit, retry=False):
+    log_rows = commit["log_rows"]
+    if retry and log_rows:
+        # An earlier attempt (or a process that stopped mid-flush) may have
+        # appended them already, or timed out after the server accepted them
+        logged = set(saleslog_ws.col_values(ORDER_ID_COL))
+        log_rows = [row for row in log_rows if row[ORDER_ID_COL - 1] not in logged]
+    if log_rows:
+        saleslog_ws.append_rows(log_rows)
+    if commit["counters"]:
+        inventory_ws.batch_update([
+            {"range": cell, "values": [[value]]}
+            for cell, value in commit["counters"].items()
+        ])
+
+# --- Shared Inventory Cache ---
+# Keys are (region, day): ("counters", day) holds the C6:S6 snapshot and
+# ("stocks", day) the Stocks Inventory table.
+@st.cache_resource(show_spinner=False)
+def get_inventory_cache():
+    return InventoryCache()
+
+inventory_cache = get_inventory_cache()
+
+# --- Sales History ---
+# Local copy of every SalesLog sheet, synced incrementally for reports
+SALES_STORE_PATH = os.environ.get("SALES_STORE_PATH", "sales_history.db")
+HISTORY_SYNC_INTERVAL = 300  # seconds between automatic syncs
+
+@st.cache_resource(show_spinner=False)
+def get_sales_store():
+    return SalesStore(SALES_STORE_PATH)
+
+sales_store = get_sales_store()
+
+# --- Order Journal ---
+# Complete Order and Remove Order only append to the local journal; the
+# flusher thread drains it to that day's sheets in batches.
+JOURNAL_PATH = os.environ.get("ORDER_JOURNAL_PATH", "order_journal.db")
+
+def prepare_journal_batch(entries):
+    day = entries[0].day
+    try:
+        with sheets_lane(COMMIT):
+            inventory_ws, _ = get_daily_worksheets(day)
+            commit = build_order_commit(entries, load_inventory_snapshot(inventory_ws))
+    except Exception as e:
+        if isinstance(e, gspread.exceptions.WorksheetNotFound) and is_past_day(day):
+            # Its tabs are gone for good; the flusher sets the batch aside
+            raise Unsyncable(str(e)) from e
+        if is_missing_sheet_error(e):
+            forget_daily_worksheets()
+        raise
+    commit["day"] = day
+    return commit
+
+def apply_journal_commit(commit, retry):
+    try:
+        with sheets_lane(COMMIT):
+            inventory_ws, saleslog_ws = get_daily_worksheets(commit["day"])
+            apply_order_commit(inventory_ws, saleslog_ws, commit, retry)
+    except Exception as e:
+        if isinstance(e, gspread.exceptions.WorksheetNotFound) and is_past_day(commit["day"]):
+            raise Unsyncable(str(e)) from e
+        if is_missing_sheet_error(e):
+            # Re-resolve the handles on the next attempt
+            forget_daily_worksheets()
+        raise
+
+def publish_journal_commit(commit):
+    # Write-through: the flushed counters become the cached snapshot
+    # (a commit resumed from the journal has it as a plain list)
+    sheet_title, counts = commit["snapshot"]
+    inventory_cache.put(("counters", commit["day"]), InventorySnapshot(sheet_title, tuple(counts)))
+    # Rows were appended to that day's SalesLog, which the history store may
+    # already have sealed (a void of an older order); the next sync reads them
+    sales_store.unseal(daily_titles(commit["day"])[1])
+
+@st.cache_resource(show_spinner=False)
+def get_order_journal():
+    journal = OrderJournal(JOURNAL_PATH)
+    flusher = JournalFlusher(journal, prepare_journal_batch, apply_journal_commit, publish_journal_commit)
+    flusher.start()
+    METRICS.register_gauge("order_journal_pending", journal.pending_count)
+    return journal, flusher
+
+order_journal, journal_flusher = get_order_journal()
+
+# --- Change Detection ---
+# One poller per process reads today's counters and stock columns in a
+# single request and offers them to the cache, so edits from other
+# terminals or the sheet itself reach every session without each one
+# polling. INVENTORY_POLLER=off turns it off (the benchmark does, since
+# its per-action request counts would otherwise pick up polls).
+POLLER_ENABLED = os.environ.get("INVENTORY_POLLER", "on") != "off"
+LIVE_REFRESH_SECONDS = 5  # how often open screens redraw from the cache
+
+def read_live_ranges():
+    day = manila_now().strftime("%Y-%m-%d")
+    try:
+        inventory_ws, _ = get_daily_worksheets(day)
+        counters, *stock_values = inventory_ws.batch_get([COUNTER_RANGE] + STOCK_RANGES)
+    except Exception as e:
+        if is_missing_sheet_error(e):
+            forget_daily_worksheets()
+        raise
+    return {
+        ("counters", day): snapshot_from_values(inventory_ws.title, counters),
+        ("stocks", day): build_stocks_table(*stock_values),
+    }
+
+@st.cache_resource(show_spinner=False)
+def start_inventory_poller():
+    if not POLLER_ENABLED:
+        return None
+    poller = InventoryPoller(read_live_ranges, inventory_cache)
+    poller.start()
+    return poller
+
+# --- Branches ---
+# Other stalls are read through connections of their own that share this
+# process's credentials and request scheduler, since the quota is per
+# service account, not per spreadsheet.
+# branch_dashboard is only imported once the All Branches tab is opened.
+@st.cache_resource(show_spinner=False)
+def get_branch_connection(branch_key):
+    from branch_dashboard import BRANCH_TIMEOUT
+    sheets = get_sheets_connection()
+    if branch_key == BRANCH.key:
+        return sheets
+    return SheetsConnection(
+        sheets.credentials, BRANCHES[branch_key].spreadsheet_id, scheduler=sheets.scheduler, timeout=BRANCH_TIMEOUT
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_branch_pool():
+    from branch_dashboard import MAX_WORKERS
+    return ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="branch-fetch")
+
+def load_branch_counts(branch, day, connection):
+    # Runs on the pool. Today at this server's own branch comes from the
+    # live cache plus the orders still in the journal.
+    from branch_dashboard import fetch_counts
+    if branch.key == BRANCH.key and day == manila_now().strftime("%Y-%m-%d"):
+        inventory_ws, _ = get_daily_worksheets(day)
+        snapshot = inventory_cache.get(("counters", day), lambda: load_inventory_snapshot(inventory_ws))
+        return apply_deltas(snapshot, order_journal.pending_deltas(day)).counts
+    return inventory_cache.get((f"branch:{branch.key}", day), lambda: fetch_counts(connection.spreadsheet(), branch, day))
+
+# --- Diagnostics ---
+# Set METRICS_PATH to have the metrics written there as Prometheus text,
+# and ADMIN_TOKEN to unlock the Diagnostics tab via ?admin=<token>.
+METRICS_PATH = os.environ.get("METRICS_PATH")
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+@st.cache_resource(show_spinner=False)
+def start_metrics_exporter():
+    METRICS.register_gauge("sheets_paused_seconds", get_sheets_connection().scheduler.retry_after)
+    if not METRICS_PATH:
+        return None
+    exporter = MetricsExporter(METRICS_PATH)
+    exporter.start()
+    return exporter
+is_admin = bool(ADMIN_TOKEN) and st.query_params.get("admin") == ADMIN_TOKEN
+
+def histogram_table(name):
+    rows = []
+    for labels, histogram in METRICS.histograms(name):
+        rows.append({
+            **labels,
+            "count": histogram.count,
+            "mean ms": round(1000 * histogram.sum / histogram.count, 1),
+            "p50 ms": round(1000 * histogram.percentile(50), 1),
+            "p95 ms": round(1000 * histogram.percentile(95), 1),
+            "p99 ms": round(1000 * histogram.percentile(99), 1),
+        })
+    return pd.DataFrame(rows)
+
+def counter_table(name):
+    return pd.DataFrame([{**labels, "count": int(value)} for labels, value in METRICS.counters(name)])
+
+# --- Voids ---
+# A void is a single journal entry: the order's counter deltas reversed
+# plus a negative copy of its SalesLog rows, keyed "void-<order id>" so
+# an order can only ever be voided once.
+VOID_PREFIX = "void-"
+
+def find_order(order_id):
+    # Orders taken on this server are in the journal; older or remote
+    # ones come from the synced sales history
+    if order_id.startswith(VOID_PREFIX):
+        return None
+    entry = order_journal.find(order_id)
+    if entry is not None and entry.kind == "order":
+        return entry.day, entry.log_rows
+    # Removals are logged as negative rows and are not orders
+    rows = [row for row in sales_store.order_rows(order_id) if row[5] > 0]
+    if rows:
+        return rows[0][0], rows
+    return None
+
+def is_voided(order_id):
+    void_id = VOID_PREFIX + order_id
+    return order_journal.find(void_id) is not None or bool(sales_store.order_rows(void_id))
+
+def reversal(log_rows, entry_id, now):
+    # Negative copies of the rows, stamped with the time of the reversal
+    deltas, rows = {}, []
+    for date, _, product, packaging, size, qty, amount, _ in log_rows:
+        cell = find_sku(product, packaging, size).cell
+        deltas[cell] = deltas.get(cell, 0) - int(qty)
+        rows.append([date, now.strftime("%H:%M:%S"), product, packaging, size, -int(qty), -int(amount), entry_id])
+    return deltas, rows
+
+def order_label(entry):
+    total = sum(int(row[6]) for row in entry.log_rows)
+    time_str = entry.log_rows[0][1] if entry.log_rows else ""
+    return f"{time_str} · #{entry.order_id} · {len(entry.log_rows)} item(s) · ₱{total}"
+
+def get_live_inventory(today_str):
+    # Synced counters from the sheet plus orders still waiting in the journal.
+    # The day's worksheets are only resolved when the cache has to load.
+    key = ("counters", today_str)
+    try:
+        with sheets_lane(REFRESH):
+            snapshot = inventory_cache.get(key, lambda: load_inventory_snapshot(get_daily_worksheets(today_str)[0]))
+    except RateLimited as e:
+        # Don't hold the cashier screen on a 429; show the last known counters
+        snapshot = inventory_cache.peek(key)
+        if snapshot is None:
+            raise
+        st.caption(f"⚠️ Showing cached counters. {e}")
+    except Exception as e:
+        if not is_missing_sheet_error(e):
+            raise
+        forget_daily_worksheets()
+        st.rerun()
+    return apply_deltas(snapshot, order_journal.pending_deltas(today_str))
+
+def show_sync_status():
+    parked = order_journal.parked()
+    if parked:
+        order_id, day, error = parked[-1]
+        st.caption(f"⚠️ {len(parked)} journal entry(s) can't be synced and were set aside. Latest: #{order_id} for {day}: {error}")
+    pending = order_journal.pending_count()
+    if not pending:
+        st.caption("✅ All orders synced to Google Sheets")
+        return
+    st.caption(f"⏳ {pending} order(s) waiting to sync to Google Sheets")
+    last_error = order_journal.last_error()
+    if last_error:
+        st.caption(f"Last sync error: {last_error}")
+
+# --- Startup ---
+# Nothing above touches the network. The first run in a fresh process
+# starts this thread and carries on drawing the page, while the thread
+# opens the spreadsheet, resolves today's sheets, starts the background
+# services and fills the counter cache. A tab that needs one of these
+# first just waits on the same cached call.
+def warm_up():
+    started = time.perf_counter()
+    today_str = manila_now().strftime("%Y-%m-%d")
+    with sheets_lane(BACKGROUND):
+        try:
+            get_daily_worksheets(today_str)
+        except Exception:
+            log.exception("Warm-up could not open today's sheets; the first tab will retry")
+        start_metrics_exporter()
+        start_rollover_scheduler()
+        start_archive_scheduler()
+        # The poller's first read fills the cache; without it, load once here
+        if start_inventory_poller() is None:
+            try:
+                inventory_cache.get(("counters", today_str), lambda: load_inventory_snapshot(get_daily_worksheets(today_str)[0]))
+            except Exception:
+                log.exception("Warm-up could not load today's counters")
+    METRICS.observe("app_warm_up_seconds", time.perf_counter() - started)
+
+@st.cache_resource(show_spinner=False)
+def start_warm_up():
+    thread = threading.Thread(target=warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+start_warm_up()
+
 # --- Streamlit App ---
 
 # Always initialize session state keys before any logic
 if "cart" not in st.session_state:
-    st.session_state["cart"] = []
+    st.session_state["cart"] = {}  # SKU index -> quantity
 if "show_change" not in st.session_state:
     st.session_state["show_change"] = False
 if "last_change" not in st.session_state:
     st.session_state["last_change"] = 0
 
 # Use tabs for navigation
-selected_tab = st.selectbox("Select Tab", ["Facebuko Sales", "Sales Summary", "Remove Order", "Stocks Inventory"])
+tabs = ["Facebuko Sales", "Sales Summary", "Remove Order", "Stocks Inventory"]
+if len(BRANCHES) > 1:
+    tabs.append("All Branches")
+if is_admin:
+    tabs.append("Diagnostics")
+selected_tab = st.selectbox("Select Tab", tabs)
+rerun_timer.tab = selected_tab
 
 if selected_tab == "Facebuko Sales":
-    inventory_ws, saleslog_ws = get_daily_worksheets()
+    today_str = manila_now().strftime("%Y-%m-%d")
     st.markdown('<h2 style="color:#21ba45;">🛒 Facebuko Sales</h2>', unsafe_allow_html=True)
-    # --- Total Sales (from Current Inventory Table) ---
-    df1, df2 = get_simple_inventory()
-    total_sales = 0
-    # Buko Juice & Buko Shake
-    for idx, row in df1.iterrows():
-        product = row['Product']
-        for size in ['Small', 'Medium', 'Large']:
-            qty = row[size]
-            if qty > 0:
-                if 'Cup' in product:
-                    price = price_map['Cup'][size]
-                elif 'Bottle' in product:
-                    price = price_map['Bottle'][size]
-                else:
-                    continue
-                total_sales += qty * price
-    # Pizza
-    pizza_row = df2.iloc[0]
-    for flavor in ['Supreme', 'Hawaiian', 'Pepperoni', 'Ham & Cheese', 'Shawarma']:
-        qty = pizza_row[flavor]
-        if qty > 0:
-            price = price_map['Box']['Supreme' if flavor == 'Supreme' else 'Others']
-            total_sales += qty * price
-    # If all inventory is zero, total_sales should be zero
-    if (df1[['Small', 'Medium', 'Large']].sum().sum() + df2[['Supreme', 'Hawaiian', 'Pepperoni', 'Ham & Cheese', 'Shawarma']].sum().sum()) == 0:
-        total_sales = 0
-    st.markdown(f"<h2 style='color:#2185d0;'>₱{total_sales:,.2f} <span style='font-size:22px;'>Total Sales</span></h2>", unsafe_allow_html=True)
+    # Placeholder, filled in after the order panel: taking orders never
+    # waits on Sheets, so the panel is drawn first
+    total_sales_slot = st.container()
     st.markdown('---')
 
-    product = st.selectbox("Select Product", ["Buko Juice", "Buko Shake", "Pizza"])
-    if product != "Pizza":
-        packaging = st.selectbox("Select Packaging", ["Cup", "Bottle"])
-        size = st.selectbox("Select Size", ["Small", "Medium", "Large"])
-        price = price_map[packaging][size]
-        pizza_type = None
-    else:
-        packaging = "Box"
-        pizza_type = st.selectbox(
-            "Select Pizza Flavor",
-            ["Supreme", "Hawaiian", "Pepperoni", "Ham & Cheese", "Shawarma"]
-        )
-        if pizza_type == "Supreme":
-            size = "Supreme"
-        else:
-            size = pizza_type
-        price = price_map[packaging]["Supreme" if pizza_type == "Supreme" else "Others"]
-    qty = st.number_input("Enter Quantity", min_value=1, step=1, key="qty")
-    amount = qty * price
-    st.write(f"**Amount: ₱{amount}**")
-    add_to_order = st.button("Add to Order", key="add_to_order_btn")
-    if add_to_order:
-        item = {
-            "product": product,
-            "packaging": packaging,
-            "size": size,
-            "qty": qty,
-            "pizza_type": pizza_type
-        }
-        st.session_state["cart"].append(item)
-        st.session_state["reset_qty"] = True
-        st.rerun()
-    st.markdown('---')
+    # --- Total Sales (from Current Inventory Table) ---
+    # Redrawn from the shared cache every few seconds, so sales taken on
+    # other terminals show up without a click and without a Sheets read
+    @st.fragment(run_every=LIVE_REFRESH_SECONDS if POLLER_ENABLED else None)
+    def live_total():
+        fragment_timer = enter_fragment(st.session_state, "live_inventory")
+        snapshot = get_live_inventory(today_str)
+        total_sales = sales_total(snapshot.counts)
+        st.markdown(f"<h2 style='color:#2185d0;'>₱{total_sales:,.2f} <span style='font-size:22px;'>Total Sales</span></h2>", unsafe_allow_html=True)
+        show_sync_status()
+        if "last_order_id" in st.session_state:
+            st.caption(f"Last order ID: {st.session_state['last_order_id']}")
+        if fragment_timer is not None:
+            fragment_timer.finish()
 
-    # --- Current Order Section ---
-    if st.session_state["cart"]:
-        st.markdown('<h2 style="color:#2185d0;">🧾 Current Order</h2>', unsafe_allow_html=True)
-        st.markdown('---')
-        remove_idx = None
-        order_total = 0
-        for idx, item in enumerate(st.session_state["cart"], 1):
-            # Calculate price for each item
-            if item["product"] == "Pizza":
-                item_price = price_map[item["packaging"]]["Supreme" if item["size"] == "Supreme" else "Others"]
-                desc = f"{item['product']} - {item['pizza_type']} (x{item['qty']})"
-            else:
-                item_price = price_map[item["packaging"]][item["size"]]
-                desc = f"{item['product']} - {item['packaging']} - {item['size']} (x{item['qty']})"
-            item_total = item_price * item["qty"]
-            order_total += item_total
-            cols = st.columns([6, 2, 1])
-            cols[0].write(f"{idx}. {desc}")
-            cols[1].write(f"₱{item_price} x {item['qty']} = ₱{item_total}")
-            if cols[2].button("X", key=f"remove_{idx}", help="Remove item from cart"):
-                remove_idx = idx - 1
-        st.markdown(f"**Total Order Price: ₱{order_total}**")
-        # Cash received input
-        cash_key = "cash_received"
-        if cash_key not in st.session_state:
-            st.session_state[cash_key] = 0
-        cash_received = st.number_input("Cash Received", min_value=0, step=1, key=cash_key)
-        if remove_idx is not None:
-            st.session_state["cart"].pop(remove_idx)
-            st.rerun()
-        submit_order = st.button("Submit Order", key="submit_order_btn")
-        # State for showing change and waiting for OK
-        if "show_change" not in st.session_state:
-            st.session_state["show_change"] = False
-        if "last_change" not in st.session_state:
-            st.session_state["last_change"] = 0
-        if submit_order and not st.session_state["show_change"]:
-            if cash_received < order_total:
-                st.error(f"Insufficient cash! Received ₱{cash_received}, need ₱{order_total}.")
+    # --- Order Entry, Cart and Checkout ---
+    # A fragment: picking items, editing the cart and entering cash only
+    # rerun this section, with no Sheets I/O and no Total Sales recompute.
+    # Cart changes are applied before the cart is drawn (inline for Add,
+    # via on_click for X), so they never need a rerun of their own.
+    @st.fragment
+    def order_panel():
+        fragment_timer = enter_fragment(st.session_state, "order_panel")
+        product = st.selectbox("Select Product", ["Buko Juice", "Buko Shake", "Pizza"])
+        if product != "Pizza":
+            packaging = st.selectbox("Select Packaging", ["Cup", "Bottle"])
+            size = st.selectbox("Select Size", ["Small", "Medium", "Large"])
+            pizza_type = None
+        else:
+            packaging = "Box"
+            pizza_type = st.selectbox(
+                "Select Pizza Flavor",
+                ["Supreme", "Hawaiian", "Pepperoni", "Ham & Cheese", "Shawarma"]
+            )
+            if pizza_type == "Supreme":
+                size = "Supreme"
             else:
-                st.session_state["last_change"] = cash_received - order_total
-                st.session_state["show_change"] = True
-                st.session_state["success_msg"] = f"Order ready to complete! {len(st.session_state['cart'])} items."
-        # Show change and Complete Order button if needed
-        if st.session_state["show_change"]:
-            st.success(f"Order submitted! Change: ₱{st.session_state['last_change']}")
-            if st.button("Complete Order", key="ok_btn"):
-                try:
-                    for item in st.session_state["cart"]:
-                        if item["product"] == "Pizza":
-                            target_cell = cell_map[item["product"]][item["packaging"]][item["size"]]
-                            item_price = price_map[item["packaging"]]["Supreme" if item["size"] == "Supreme" else "Others"]
-                            size_or_flavor = item["pizza_type"]
-                        else:
-                            target_cell = cell_map[item["product"]][item["packaging"]][item["size"]]
-                            item_price = price_map[item["packaging"]][item["size"]]
-                            size_or_flavor = item["size"]
-                        current_value = inventory_ws.acell(target_cell).value
-                        current_value = int(current_value) if current_value and str(current_value).isdigit() else 0
-                        new_value = current_value + item["qty"]
-                        inventory_ws.update_acell(target_cell, new_value)
-                        # Log each item in the sales log
-                        ph_tz = pytz.timezone("Asia/Manila")
-                        now = datetime.now(ph_tz)
-                        saleslog_ws.append_row([
-                            now.strftime("%Y-%m-%d"),
-                            now.strftime("%H:%M:%S"),
-                            item["product"],
-                            item["packaging"],
-                            size_or_flavor,
-                            item["qty"],
-                            item_price * item["qty"]
-                        ])
-                    st.session_state["cart"] = []
-                    st.session_state["show_change"] = False
-                    st.session_state["last_change"] = 0
-                    st.session_state.pop("success_msg", None)
-                    st.cache_data.clear()
-                    st.rerun()
-                except Exception as e:
-                    st.error(f"Error: {e}")
+                size = pizza_type
+        sku = find_sku(product, packaging, size)
+        price = sku.price
+        qty = st.number_input("Enter Quantity", min_value=1, step=1, key="qty")
+        amount = qty * price
+        st.write(f"**Amount: ₱{amount}**")
+        add_to_order = st.button("Add to Order", key="add_to_order_btn")
+        if add_to_order:
+            cart = st.session_state["cart"]
+            cart[sku.index] = cart.get(sku.index, 0) + qty
+            st.session_state["reset_qty"] = True
         st.markdown('---')
 
+        # --- Current Order Section ---
+        if st.session_state["cart"]:
+            st.markdown('<h2 style="color:#2185d0;">🧾 Current Order</h2>', unsafe_allow_html=True)
+            st.markdown('---')
+            order_total = sales_total(cart_vector(st.session_state["cart"]))
+            for idx, (sku_index, item_qty) in enumerate(st.session_state["cart"].items(), 1):
+                item_sku = SKUS[sku_index]
+                item_total = item_sku.price * item_qty
+                cols = st.columns([6, 2, 1])
+                cols[0].write(f"{idx}. {item_sku.label} (x{item_qty})")
+                cols[1].write(f"₱{item_sku.price} x {item_qty} = ₱{item_total}")
+                cols[2].button(
+                    "X",
+                    key=f"remove_{sku_index}",
+                    help="Remove item from cart",
+                    on_click=st.session_state["cart"].pop,
+                    args=(sku_index, None)
+                )
+            st.markdown(f"**Total Order Price: ₱{order_total}**")
+            # Cash received input
+            cash_key = "cash_received"
+            if cash_key not in st.session_state:
+                st.session_state[cash_key] = 0
+            cash_received = st.number_input("Cash Received", min_value=0, step=1, key=cash_key)
+            submit_order = st.button("Submit Order", key="submit_order_btn")
+            # State for showing change and waiting for OK
+            if "show_change" not in st.session_state:
+                st.session_state["show_change"] = False
+            if "last_change" not in st.session_state:
+                st.session_state["last_change"] = 0
+            if submit_order and not st.session_state["show_change"]:
+                if cash_received < order_total:
+                    st.error(f"Insufficient cash! Received ₱{cash_received}, need ₱{order_total}.")
+                else:
+                    st.session_state["last_change"] = cash_received - order_total
+                    st.session_state["show_change"] = True
+                    # Idempotency key for this order, kept across Complete Order retries
+                    # so a double click can't journal the same sale twice
+                    st.session_state["order_id"] = new_order_id()
+                    st.session_state["success_msg"] = f"Order ready to complete! {len(st.session_state['cart'])} items."
+            # Show change and Complete Order button if needed
+            if st.session_state["show_change"]:
+                st.success(f"Order submitted! Change: ₱{st.session_state['last_change']}")
+                if st.button("Complete Order", key="ok_btn"):
+                    try:
+                        now = manila_now()
+                        cart = st.session_state["cart"]
+                        order_id = st.session_state["order_id"]
+                        order_journal.append(
+                            order_id,
+                            now.strftime("%Y-%m-%d"),
+                            "order",
+                            cart_deltas(cart),
+                            order_log_rows(cart, order_id, now)
+                        )
+                        journal_flusher.notify()
+                        st.session_state["last_order_id"] = order_id
+                        st.session_state.pop("order_id", None)
+                        st.session_state["cart"] = {}
+                        st.session_state["show_change"] = False
+                        st.session_state["last_change"] = 0
+                        st.session_state.pop("success_msg", None)
+                        # Full rerun so the Total Sales header picks up the order
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"Error: {e}")
+            st.markdown('---')
+        if fragment_timer is not None:
+            fragment_timer.finish()
+
+    order_panel()
+    rerun_timer.interactive()
+    with total_sales_slot:
+        live_total()
+
 elif selected_tab == "Sales Summary":
-    inventory_ws, _ = get_daily_worksheets()
+    today_str = manila_now().strftime("%Y-%m-%d")
     st.markdown('<h2 style="color:#f2711c;">📦 Sales Summary</h2>', unsafe_allow_html=True)
     st.markdown('---')
     if st.button("Refresh Inventory"):
-        st.cache_data.clear()
-    df1, df2 = get_simple_inventory()
-    st.dataframe(df1, hide_index=True)
-    st.dataframe(df2, hide_index=True)
+        inventory_cache.invalidate(("counters", today_str))
+
+    @st.fragment(run_every=LIVE_REFRESH_SECONDS if POLLER_ENABLED else None)
+    def live_summary():
+        fragment_timer = enter_fragment(st.session_state, "live_inventory")
+        df1, df2 = get_simple_inventory(get_live_inventory(today_str))
+        show_sync_status()
+        st.dataframe(df1, hide_index=True)
+        st.dataframe(df2, hide_index=True)
+        if fragment_timer is not None:
+            fragment_timer.finish()
+
+    live_summary()
+    st.markdown('---')
+
+    # --- Sales History (from the local sales store) ---
+    rerun_timer.section("sales_history")
+    st.markdown('<h3 style="color:#f2711c;">📈 Sales History</h3>', unsafe_allow_html=True)
+    today = manila_now().date()
+    history_range = st.date_input("Date Range", (today - timedelta(days=6), today), key="history_range")
+    group_by = st.selectbox("Group By", ["day", "product", "size", "hour"], format_func=str.title, key="history_group_by")
+    sync_history = st.button("Sync History", key="sync_history_btn")
+    if len(history_range) == 2:
+        start_day, end_day = (d.strftime("%Y-%m-%d") for d in history_range)
+        # Only the rows appended since the last sync are fetched, and a range
+        # any session synced recently isn't even listed again
+        if sync_history or time.time() - sales_store.last_synced(start_day, end_day) > HISTORY_SYNC_INTERVAL:
+            try:
+                with sheets_lane(REFRESH), st.spinner("Syncing sales history..."):
+                    sales_store.sync(get_sheets_connection().spreadsheet(), start_day, end_day)
+            except Exception as e:
+                st.warning(f"Showing stored history only. {e}")
+        history = sales_store.aggregate(start_day, end_day, group_by)
+        st.dataframe(history, hide_index=True)
+        st.markdown(f"**Total: ₱{history['amount'].sum():,.2f}**")
     st.markdown('---')
 
 elif selected_tab == "Remove Order":
-    inventory_ws, _ = get_daily_worksheets()
+    from sheet_archive import ARCHIVE_AFTER_DAYS, archive_cutoff
+    today_str = manila_now().strftime("%Y-%m-%d")
     st.markdown('<h2 style="color:#db2828;">➖ Remove Order</h2>', unsafe_allow_html=True)
+    if "remove_msg" in st.session_state:
+        st.success(st.session_state.pop("remove_msg"))
+
+    # --- Void a whole order by ID ---
+    st.markdown('<h3 style="color:#db2828;">🧾 Void an Order</h3>', unsafe_allow_html=True)
+    recent_orders = {entry.order_id: entry for entry in order_journal.recent(today_str, "order")}
+    picked_id = st.selectbox(
+        "Today's Orders",
+        list(recent_orders),
+        index=None,
+        format_func=lambda order_id: order_label(recent_orders[order_id]),
+        placeholder="Choose an order",
+        key="void_pick"
+    )
+    typed_id = st.text_input("...or enter an Order ID", key="void_order_id").strip().lstrip("#")
+    void_target = typed_id or picked_id
+    if void_target:
+        found = find_order(void_target)
+        if found is None:
+            st.warning(f"No order {void_target} found. If it was taken on another device, sync Sales History first.")
+        else:
+            order_day, order_rows = found
+            st.dataframe(pd.DataFrame(order_rows, columns=SALESLOG_COLUMNS), hide_index=True)
+            if is_voided(void_target):
+                st.info(f"Order {void_target} has already been voided.")
+            elif order_day < archive_cutoff(ARCHIVE_KEEP_DAYS or ARCHIVE_AFTER_DAYS):
+                # Its daily sheets have been (or are about to be) archived
+                st.info(f"Order {void_target} is from {order_day}, which has been archived; it can't be voided here.")
+            elif st.button("Void Order", key="void_order_btn"):
+                rerun_timer.section("void_order")
+                try:
+                    # The day's tabs must still exist, or the void could never sync
+                    get_daily_worksheets(order_day)
+                    void_id = VOID_PREFIX + void_target
+                    deltas, void_rows = reversal(order_rows, void_id, manila_now())
+                    order_journal.append(void_id, order_day, "void", deltas, void_rows)
+                    journal_flusher.notify()
+                    st.session_state["remove_msg"] = f"Voided order {void_target} (₱{-sum(row[6] for row in void_rows)})."
+                    st.rerun()
+                except gspread.exceptions.WorksheetNotFound as e:
+                    st.error(f"Order {void_target} can't be voided: {e}")
+                except Exception as e:
+                    st.error(f"Error: {e}")
+    st.markdown('---')
+
+    # --- Remove individual items ---
+    st.markdown('<h3 style="color:#db2828;">Remove Items</h3>', unsafe_allow_html=True)
     remove_product = st.selectbox("Select Product to Remove", ["Buko Juice", "Buko Shake", "Pizza"], key="remove_product")
     if remove_product != "Pizza":
         remove_packaging = st.selectbox("Select Packaging", ["Cup", "Bottle"], key="remove_packaging")
@@ -350,94 +730,90 @@ elif selected_tab == "Remove Order":
         else:
             remove_size = remove_pizza_type
     remove_qty = st.number_input("Enter Quantity to Remove", min_value=1, step=1, key="remove_qty")
-    # Add cooldown to prevent rapid repeated calls
-    if "remove_order_cooldown" not in st.session_state:
-        st.session_state["remove_order_cooldown"] = 0
-    import time
-    now = time.time()
-    cooldown_period = 3  # seconds
-    cooldown_left = cooldown_period - (now - st.session_state["remove_order_cooldown"])
-    button_disabled = cooldown_left > 0
-    if st.button("Remove Order", key="remove_order_btn", disabled=button_disabled):
-        max_retries = 5
-        for attempt in range(max_retries):
-            try:
-                if remove_product == "Pizza":
-                    target_cell = cell_map[remove_product][remove_packaging][remove_size]
-                else:
-                    target_cell = cell_map[remove_product][remove_packaging][remove_size]
-                current_value = inventory_ws.acell(target_cell).value
-                current_value = int(current_value) if current_value and str(current_value).isdigit() else 0
-                new_value = max(0, current_value - remove_qty)
-                inventory_ws.update_acell(target_cell, new_value)
-                st.success(f"Removed {remove_qty} from {remove_product} {remove_packaging} {remove_size if not remove_pizza_type else remove_pizza_type}.")
-                st.session_state["remove_order_cooldown"] = time.time()
-                st.cache_data.clear()
-                st.rerun()
-            except gspread.exceptions.APIError as e:
-                import random
-                wait_time = (2 ** attempt) + random.uniform(0, 1)
-                if attempt < max_retries - 1:
-                    st.warning(f"Google Sheets API rate limit hit. Retrying in {wait_time:.1f} seconds...")
-                    time.sleep(wait_time)
-                else:
-                    st.error("Google Sheets API rate limit reached. Please wait a few seconds and try again.")
-                    break
-            except Exception as e:
-                st.error(f"Error: {e}")
-                break
-    if cooldown_left > 0:
-        st.info(f"Please wait {int(cooldown_left)+1}s before removing another order.")
+    # Journaled like an order, so there is nothing to wait for and no cooldown;
+    # the negative log row keeps SalesLog in step with the counters
+    if st.button("Remove Order", key="remove_order_btn"):
+        rerun_timer.section("remove_order")
+        sku = find_sku(remove_product, remove_packaging, remove_size)
+        try:
+            remove_id = new_order_id()
+            removal = {sku.index: -remove_qty}
+            order_journal.append(remove_id, today_str, "remove", cart_deltas(removal), order_log_rows(removal, remove_id, manila_now()))
+            journal_flusher.notify()
+            st.session_state["remove_msg"] = f"Removed {remove_qty} x {sku.label}."
+            st.rerun()
+        except Exception as e:
+            st.error(f"Error: {e}")
+    show_sync_status()
     st.markdown('---')
 
 elif selected_tab == "Stocks Inventory":
     st.markdown('<h2 style="color:#a333c8;">📊 Stocks Inventory</h2>', unsafe_allow_html=True)
     st.markdown('---')
-    stocks = [
-        "Milk", "Sugar", "buko", "S-Bottle", "M-Bottle", "L-Bottle", "S-Cup", "M-Cup", "L-Cup", "Dough", "Pizza sauce", "Ham", "Pepperoni", "Pineapple", "Beep/Bacon", "W Onion", "Bellpepper", "Mushroom", "Hot Sauce", "Catsup", "Beef Shawarma", "Pizza Cheese", "Mozza Cheese", "Pizza Box", "Ice", "Plastic Twine", "Tissue", "Spoon", "Straw", "Sando bag", "Carrier bag", "Siomai"
-    ]
-    start_row = 17  # Start one row below the title
+    stocks = STOCK_ITEMS
+    start_row = STOCK_START_ROW
+
+    today_str = manila_now().strftime("%Y-%m-%d")
+    stocks_key = ("stocks", today_str)
 
     def fetch_stocks_table():
-        # Connect and fetch all stocks data from Google Sheets
-        creds_b64 = os.environ["GOOGLE_SERVICE_ACCOUNT_B64"]
-        creds_bytes = base64.b64decode(creds_b64)
-        creds_dict = json.loads(creds_bytes.decode("utf-8"))
-        scope = ["https://www.googleapis.com/auth/spreadsheets"]
-        creds = Credentials.from_service_account_info(creds_dict, scopes=scope)
-        client = gspread.authorize(creds)
-        today_str = datetime.now(pytz.timezone("Asia/Manila")).strftime("%Y-%m-%d")
-        inventory_title = f"MighteeMart1_{today_str}"
-        spreadsheet = client.open_by_key(SPREADSHEET_ID)
-        inventory_ws = spreadsheet.worksheet(inventory_title)
-        beg_bal_range = inventory_ws.get(f"G{start_row}:G{start_row+len(stocks)-1}")
-        qty_in_range = inventory_ws.get(f"I{start_row}:I{start_row+len(stocks)-1}")
-        end_bal_range = inventory_ws.get(f"M{start_row}:M{start_row+len(stocks)-1}")
-        table_data = []
-        for i, stock in enumerate(stocks):
-            beg_bal = beg_bal_range[i][0] if i < len(beg_bal_range) and beg_bal_range[i] else None
-            qty_in = qty_in_range[i][0] if i < len(qty_in_range) and qty_in_range[i] else None
-            end_bal = end_bal_range[i][0] if i < len(end_bal_range) and end_bal_range[i] else None
-            beg_bal = float(beg_bal) if beg_bal not in (None, "") else None
-            qty_in = float(qty_in) if qty_in not in (None, "") else None
-            end_bal = float(end_bal) if end_bal not in (None, "") else None
-            table_data.append({
-                "Stock": stock,
-                "Beg. Bal": beg_bal,
-                "Qty. In": qty_in,
-                "Ending Bal": end_bal
-            })
-        return table_data
-
-    # Use session state to cache table data
-    if "stocks_table_data" not in st.session_state:
-        st.session_state["stocks_table_data"] = fetch_stocks_table()
+        # All three columns in one request through the shared client
+        inventory_ws, _ = get_daily_worksheets(today_str)
+        return build_stocks_table(*inventory_ws.batch_get(STOCK_RANGES))
+
+    def stock_changes(base_table, edited_df):
+        # {(row, column): value} for the cells the editor actually changed.
+        # A blank edit keeps the sheet value, as before.
+        changes = {}
+        for column in STOCK_COLUMNS:
+            for i, new_val in enumerate(edited_df[column]):
+                if pd.isna(new_val) or new_val == "":
+                    continue
+                old_val = base_table[i][column]
+                if old_val is None or float(new_val) != old_val:
+                    changes[(i, column)] = int(new_val)
+        return changes
+
+    def save_stock_changes(base_table, changes):
+        inventory_ws, _ = get_daily_worksheets(today_str)
+        # Optimistic check: every changed cell must still hold the value the
+        # editor was loaded from, otherwise someone else saved in between.
+        current = build_stocks_table(*inventory_ws.batch_get(STOCK_RANGES))
+        stale = [
+            stocks[i] for (i, column) in changes
+            if current[i][column] != base_table[i][column]
+        ]
+        if stale:
+            inventory_cache.put(stocks_key, current)
+            return sorted(set(stale), key=stocks.index)
+        inventory_ws.batch_update([
+            {"range": f"{STOCK_COLUMNS[column]}{start_row + i}", "values": [[value]]}
+            for (i, column), value in changes.items()
+        ])
+        # Write-through: the loaded table plus what was just written
+        saved = [dict(row) for row in current]
+        for (i, column), value in changes.items():
+            saved[i][column] = float(value)
+        inventory_cache.put(stocks_key, saved)
+        return []
 
     if st.button("Refresh Inventory", key="refresh_stocks_btn"):
-        st.session_state["stocks_table_data"] = fetch_stocks_table()
+        inventory_cache.invalidate(stocks_key)
         st.success("Stocks inventory refreshed from Google Sheets.")
 
-    df = pd.DataFrame(st.session_state["stocks_table_data"])
+    # Shared across sessions; saves below write through to it. A save is
+    # checked against the table this session's editor was drawn from, kept
+    # per session, not against what another terminal has written since.
+    rerun_timer.section("stocks_table")
+    saving = st.session_state.get("save_stocks_btn") or st.session_state.get("fill_ending_btn")
+    drawn = st.session_state.get("stocks_base")
+    if saving and drawn is not None and drawn[0] == today_str:
+        stocks_table_data = drawn[1]
+    else:
+        stocks_table_data = inventory_cache.get(stocks_key, fetch_stocks_table)
+        st.session_state["stocks_base"] = (today_str, stocks_table_data)
+
+    df = pd.DataFrame(stocks_table_data)
     edited_df = st.data_editor(
         df,
         column_config={
@@ -450,80 +826,147 @@ elif selected_tab == "Stocks Inventory":
         num_rows="fixed"
     )
     if st.button("Save Stocks", key="save_stocks_btn"):
-        try:
-            import pandas as pd  # Ensure pd is available in this scope
-            # Connect to Google Sheets and get today's worksheet only when saving
-            creds_b64 = os.environ["GOOGLE_SERVICE_ACCOUNT_B64"]
-            creds_bytes = base64.b64decode(creds_b64)
-            creds_dict = json.loads(creds_bytes.decode("utf-8"))
-            scope = ["https://www.googleapis.com/auth/spreadsheets"]
-            creds = Credentials.from_service_account_info(creds_dict, scopes=scope)
-            client = gspread.authorize(creds)
-            today_str = datetime.now(pytz.timezone("Asia/Manila")).strftime("%Y-%m-%d")
-            inventory_title = f"MighteeMart1_{today_str}"
-            spreadsheet = client.open_by_key(SPREADSHEET_ID)
-            inventory_ws = spreadsheet.worksheet(inventory_title)
-            # Fetch all current values in a single batch to minimize API calls
-            beg_bal_range = inventory_ws.get(f"G{start_row}:G{start_row+len(stocks)-1}")
-            qty_in_range = inventory_ws.get(f"I{start_row}:I{start_row+len(stocks)-1}")
-            end_bal_range = inventory_ws.get(f"M{start_row}:M{start_row+len(stocks)-1}")
-            beg_bal_updates = []
-            qty_in_updates = []
-            end_bal_updates = []
-            for i, row in edited_df.iterrows():
-                beg_val = row["Beg. Bal"]
-                qty_val = row["Qty. In"]
-                end_val = row["Ending Bal"]
-                # Defensive: check if the row exists and has a value, else use None
-                beg_old = beg_bal_range[i][0] if i < len(beg_bal_range) and beg_bal_range[i] and len(beg_bal_range[i]) > 0 else None
-                qty_old = qty_in_range[i][0] if i < len(qty_in_range) and qty_in_range[i] and len(qty_in_range[i]) > 0 else None
-                end_old = end_bal_range[i][0] if i < len(end_bal_range) and end_bal_range[i] and len(end_bal_range[i]) > 0 else None
-                if pd.isna(beg_val) or beg_val == "":
-                    beg_bal_updates.append([beg_old])
-                else:
-                    beg_bal_updates.append([int(beg_val)])
-                if pd.isna(qty_val) or qty_val == "":
-                    qty_in_updates.append([qty_old])
-                else:
-                    qty_in_updates.append([int(qty_val)])
-                if pd.isna(end_val) or end_val == "":
-                    end_bal_updates.append([end_old])
+        rerun_timer.section("stocks_save")
+        changes = stock_changes(stocks_table_data, edited_df)
+        if not changes:
+            st.info("No changes to save.")
+        else:
+            try:
+                stale = save_stock_changes(stocks_table_data, changes)
+                if stale:
+                    st.error(
+                        f"{', '.join(stale)} changed on another terminal since this table was loaded. "
+                        "The table has been reloaded; please re-enter your changes."
+                    )
                 else:
-                    end_bal_updates.append([int(end_val)])
-            inventory_ws.update(f"G{start_row}:G{start_row+len(stocks)-1}", beg_bal_updates)
-            inventory_ws.update(f"I{start_row}:I{start_row+len(stocks)-1}", qty_in_updates)
-            inventory_ws.update(f"M{start_row}:M{start_row+len(stocks)-1}", end_bal_updates)
-            # Update session state cache after saving
-            st.session_state["stocks_table_data"] = fetch_stocks_table()
-            st.success("Stocks updated successfully!")
-            st.cache_data.clear()
-            st.rerun()
-        except Exception as e:
-            st.error(f"Error updating stocks: {e}")
+                    st.success("Stocks updated successfully!")
+                    st.rerun()
+            except Exception as e:
+                st.error(f"Error updating stocks: {e}")
     if st.button("Clear All", key="clear_stocks_btn"):
+        rerun_timer.section("stocks_clear")
         try:
-            creds_b64 = os.environ["GOOGLE_SERVICE_ACCOUNT_B64"]
-            creds_bytes = base64.b64decode(creds_b64)
-            creds_dict = json.loads(creds_bytes.decode("utf-8"))
-            scope = ["https://www.googleapis.com/auth/spreadsheets"]
-            creds = Credentials.from_service_account_info(creds_dict, scopes=scope)
-            client = gspread.authorize(creds)
-            today_str = datetime.now(pytz.timezone("Asia/Manila")).strftime("%Y-%m-%d")
-            inventory_title = f"MighteeMart1_{today_str}"
-            spreadsheet = client.open_by_key(SPREADSHEET_ID)
-            inventory_ws = spreadsheet.worksheet(inventory_title)
-            blank_values = [[""] for _ in stocks]
-            inventory_ws.update(f"G{start_row}:G{start_row+len(stocks)-1}", blank_values)
-            inventory_ws.update(f"I{start_row}:I{start_row+len(stocks)-1}", blank_values)
-            inventory_ws.update(f"M{start_row}:M{start_row+len(stocks)-1}", blank_values)
-            st.session_state["stocks_table_data"] = fetch_stocks_table()
+            inventory_ws, _ = get_daily_worksheets(today_str)
+            # One values:batchClear for all three columns
+            inventory_ws.batch_clear(STOCK_RANGES)
+            inventory_cache.put(stocks_key, build_stocks_table([], [], []))
             st.success("All stocks fields cleared!")
-            st.cache_data.clear()
             st.rerun()
         except Exception as e:
             st.error(f"Error clearing stocks: {e}")
     st.markdown('---')
 
+    # --- Usage from Sales ---
+    # Theoretical usage of today's sales (counters plus orders still in the
+    # journal) through the recipe matrix, against what was counted.
+    rerun_timer.section("stocks_usage")
+    st.markdown('<h3 style="color:#a333c8;">🧮 Stock Usage from Sales</h3>', unsafe_allow_html=True)
+    used = None
+    if not BOM.any():
+        # Nothing is filled from sales until real recipes are configured
+        st.caption(f"No recipes configured. Add them to {RECIPES_FILE} to compare counts against sales.")
+    else:
+        try:
+            used = stock_usage(get_live_inventory(today_str).counts)
+        except RateLimited as e:
+            st.caption(f"⚠️ Usage unavailable until today's counters load. {e}")
+    if used is not None:
+        tracked = BOM.any(axis=0)  # items with a recipe; the rest stay manual
+        report = pd.DataFrame(stocks_table_data)
+        report["Used (sales)"] = used.round(2)
+        report["Expected Ending"] = (report["Beg. Bal"].fillna(0) + report["Qty. In"].fillna(0) - used).round(2)
+        report["Variance"] = (report["Ending Bal"] - report["Expected Ending"]).round(2)
+        st.dataframe(report[tracked], hide_index=True)
+        # Uncounted rows can take the expected value instead of a manual count
+        fill = {
+            (i, "Ending Bal"): float(report.at[i, "Expected Ending"])
+            for i in range(len(stocks))
+            if tracked[i] and pd.isna(report.at[i, "Ending Bal"])
+            and not (pd.isna(report.at[i, "Beg. Bal"]) and pd.isna(report.at[i, "Qty. In"]))
+        }
+        if st.button(f"Fill {len(fill)} blank Ending Bal from sales", key="fill_ending_btn", disabled=not fill):
+            rerun_timer.section("stocks_fill")
+            try:
+                stale = save_stock_changes(stocks_table_data, fill)
+                if stale:
+                    st.error(f"{', '.join(stale)} changed on another terminal; the table has been reloaded.")
+                else:
+                    st.rerun()
+            except Exception as e:
+                st.error(f"Error filling stocks: {e}")
+    st.markdown('---')
+
+elif selected_tab == "All Branches":
+    st.markdown('<h2 style="color:#00b5ad;">🏬 All Branches</h2>', unsafe_allow_html=True)
+    st.markdown('---')
+    branches_day = st.date_input("Day", manila_now().date(), key="branches_day").strftime("%Y-%m-%d")
+    if st.button("Refresh Branches", key="refresh_branches_btn"):
+        for key in BRANCHES:
+            inventory_cache.invalidate((f"branch:{key}", branches_day))
+    from branch_dashboard import branch_table, fetch_all, product_table
+    rerun_timer.section("branches")
+    connections = {key: get_branch_connection(key) for key in BRANCHES}
+    results = fetch_all(
+        list(BRANCHES.values()),
+        lambda branch: load_branch_counts(branch, branches_day, connections[branch.key]),
+        get_branch_pool()
+    )
+    for result in results:
+        METRICS.observe("branch_fetch_seconds", result.seconds, branch=result.branch.key, status=result.status)
+    summary = branch_table(results)
+    combined = summary["Total Sales"].fillna(0).sum()
+    st.markdown(f"<h2 style='color:#2185d0;'>₱{combined:,.2f} <span style='font-size:22px;'>Combined Sales</span></h2>", unsafe_allow_html=True)
+    missing = summary.loc[summary["Total Sales"].isna(), "Branch"].tolist()
+    if missing:
+        st.caption(f"⚠️ Not included: {', '.join(missing)}")
+    st.dataframe(summary, hide_index=True)
+    st.dataframe(product_table(results), hide_index=True)
+    st.markdown('---')
+
+elif selected_tab == "Diagnostics":
+    rerun_timer.section("diagnostics")
+    st.markdown('<h2 style="color:#767676;">🩺 Diagnostics</h2>', unsafe_allow_html=True)
+    uptime = time.time() - METRICS.started_at
+    gauges = METRICS.gauges()
+    cols = st.columns(3)
+    cols[0].metric("Uptime", f"{uptime / 3600:.1f} h")
+    cols[1].metric("Orders waiting to sync", int(gauges.get("order_journal_pending", 0)))
+    cols[2].metric("Sheets backoff", f"{gauges.get('sheets_paused_seconds', 0):.0f} s")
+    st.markdown("**Script reruns**")
+    st.dataframe(histogram_table("app_rerun_seconds"), hide_index=True)
+    st.markdown("**Time to interactive** (session_start is a freshly opened page)")
+    cols = st.columns(2)
+    cold_start = METRICS.histograms("app_cold_start_seconds")
+    cols[0].metric("Cold start", f"{cold_start[0][1].sum:.2f} s" if cold_start else "–")
+    warm_up_hist = METRICS.histograms("app_warm_up_seconds")
+    cols[1].metric("Background warm-up", f"{warm_up_hist[0][1].sum:.2f} s" if warm_up_hist else "–")
+    st.dataframe(histogram_table("app_interactive_seconds"), hide_index=True)
+    st.markdown("**Sections**")
+    st.dataframe(histogram_table("app_section_seconds"), hide_index=True)
+    st.markdown("**Sheets requests** (by app section; background threads are lane-labelled)")
+    st.dataframe(counter_table("sheets_requests_total"), hide_index=True)
+    st.dataframe(histogram_table("sheets_request_seconds"), hide_index=True)
+    st.markdown("**Quota pressure**")
+    cols = st.columns(3)
+    cols[0].metric("Retries after 429", int(sum(v for _, v in METRICS.counters("sheets_retries_total"))))
+    cols[1].metric("Fast-failed (rate limited)", int(sum(v for _, v in METRICS.counters("sheets_rate_limited_total"))))
+    cols[2].metric("Coalesced reads", int(sum(v for _, v in METRICS.counters("sheets_coalesced_total"))))
+    st.dataframe(histogram_table("sheets_queue_seconds"), hide_index=True)
+    st.markdown("**Inventory cache**")
+    cache_requests = counter_table("inventory_cache_requests_total")
+    if not cache_requests.empty:
+        cache_requests = cache_requests.pivot_table(index="region", columns="result", values="count", fill_value=0)
+        cache_requests["hit ratio"] = (cache_requests.get("hit", 0) / cache_requests.sum(axis=1)).round(3)
+        st.dataframe(cache_requests)
+    st.markdown("**Change poller**")
+    cols = st.columns(2)
+    cols[0].metric("Poll interval", f"{gauges.get('inventory_poll_interval_seconds', 0):.0f} s")
+    cols[1].metric("Changes picked up", int(sum(v for labels, v in METRICS.counters("inventory_polls_total") if labels["result"] == "changed")))
+    st.markdown("**Journal flushes**")
+    st.dataframe(histogram_table("journal_flush_seconds"), hide_index=True)
+    st.download_button("Download Prometheus metrics", METRICS.render_prometheus(), file_name="metrics.prom", mime="text/plain")
+    st.markdown('---')
+
 # --- Place this at the very end of the script ---
 # st.subheader("Current Inventory")
 # if st.button("Refresh Inventory"):
@@ -565,4 +1008,6 @@ st.markdown("""
         align-items: center;
     }
     </style>
-""", unsafe_allow_html=True)
\ No newline at end of file
+""", unsafe_allow_html=True)
+
+rerun_timer.finish()
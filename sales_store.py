@@ -0,0 +1,165 @@
+import sqlite3
+import threading
+import time
+from datetime import timedelta
+
+import pandas as pd
+
+from store_config import SALESLOG_NAME, manila_now
+
+# --- Local Sales History Store ---
+# Every SalesLog_YYYY-MM-DD sheet is copied here incrementally: each
+# sheet keeps a row watermark and a sync only reads the rows appended
+# after it. SalesLog sheets are append-only, so rows below the
+# watermark never need to be read again.
+SEAL_AFTER_DAYS = 2  # older sheets are complete and no longer re-read
+MMAP_SIZE = 256 * 1024 * 1024
+FIRST_DAY, LAST_DAY = "0000-00-00", "9999-99-99"  # bounds of an open-ended sync
+
+# Grouping columns for aggregate()
+GROUPINGS = {
+    "day": ["day"],
+    "product": ["product"],
+    "size": ["product", "packaging", "size"],
+    "hour": ["hour"],
+}
+
+def to_number(value):
+    try:
+        return float(str(value).replace(",", "").replace("₱", "") or 0)
+    except ValueError:
+        return 0.0
+
+class SalesStore:
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS sales (
+                sheet TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                time TEXT,
+                hour INTEGER,
+                product TEXT,
+                packaging TEXT,
+                size TEXT,
+                qty INTEGER NOT NULL,
+                amount REAL NOT NULL,
+                order_id TEXT,
+                PRIMARY KEY (sheet, row)
+            );
+            CREATE INDEX IF NOT EXISTS sales_day ON sales (day);
+            CREATE INDEX IF NOT EXISTS sales_order ON sales (order_id);
+            CREATE TABLE IF NOT EXISTS watermarks (
+                sheet TEXT PRIMARY KEY,
+                last_row INTEGER NOT NULL,
+                sealed INTEGER NOT NULL DEFAULT 0,
+                synced_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS sync_runs (
+                start_day TEXT NOT NULL,
+                end_day TEXT NOT NULL,
+                synced_at REAL NOT NULL,
+                PRIMARY KEY (start_day, end_day)
+            );
+        """)
+
+    def watermark(self, sheet):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_row, sealed FROM watermarks WHERE sheet = ?", (sheet,)
+            ).fetchone()
+        return (row[0], bool(row[1])) if row else (1, False)  # row 1 is the header
+
+    def last_synced(self, start_day=None, end_day=None):
+        # Latest sync run that covered the whole range, even one that read nothing
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(synced_at) FROM sync_runs WHERE start_day <= ? AND end_day >= ?",
+                (start_day or FIRST_DAY, end_day or LAST_DAY)
+            ).fetchone()
+        return row[0] or 0.0
+
+    def unseal(self, sheet):
+        # Rows appended after sealing (a void) are read again by the next sync
+        with self._lock:
+            self._conn.execute("UPDATE watermarks SET sealed = 0 WHERE sheet = ?", (sheet,))
+
+    def add_rows(self, sheet, day, first_row, values, sealed=False):
+        records = []
+        for offset, values_row in enumerate(values):
+            values_row = list(values_row) + [""] * (8 - len(values_row))
+            date, time_str, product, packaging, size, qty, amount, order_id = values_row[:8]
+            if not product:
+                continue
+            hour = int(time_str.split(":")[0]) if time_str[:2].isdigit() else None
+            records.append((
+                sheet, first_row + offset, date or day, time_str, hour,
+                product, packaging, size, int(to_number(qty)), to_number(amount), order_id or None
+            ))
+        last_row = first_row + len(values) - 1
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO sales VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", records
+                )
+                self._conn.execute(
+                    "INSERT INTO watermarks (sheet, last_row, sealed, synced_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(sheet) DO UPDATE SET last_row = MAX(last_row, excluded.last_row), "
+                    "sealed = excluded.sealed, synced_at = excluded.synced_at",
+                    (sheet, max(last_row, first_row - 1), int(sealed), time.time())
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return len(records)
+
+    def sync_sheet(self, ws, day, sealed=False):
+        last_row, already_sealed = self.watermark(ws.title)
+        if already_sealed:
+            return 0
+        # Only the tail past the watermark, open-ended to the last row
+        values = ws.get(f"A{last_row + 1}:H")
+        return self.add_rows(ws.title, day, last_row + 1, values, sealed)
+
+    def sync(self, spreadsheet, start_day=None, end_day=None):
+        # One metadata fetch, then one read per unsealed sheet in range
+        prefix = f"{SALESLOG_NAME}_"
+        seal_before = (manila_now() - timedelta(days=SEAL_AFTER_DAYS)).strftime("%Y-%m-%d")
+        added = 0
+        for ws in spreadsheet.worksheets():
+            if not ws.title.startswith(prefix):
+                continue
+            day = ws.title[len(prefix):]
+            if (start_day and day < start_day) or (end_day and day > end_day):
+                continue
+            added += self.sync_sheet(ws, day, sealed=day < seal_before)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_runs (start_day, end_day, synced_at) VALUES (?, ?, ?)",
+                (start_day or FIRST_DAY, end_day or LAST_DAY, time.time())
+            )
+        return added
+
+    def order_rows(self, order_id):
+        # SalesLog rows of one order, as logged: Date, Time, Product, Packaging, Size, Qty, Amount, Order ID
+        with self._lock:
+            return [list(row) for row in self._conn.execute(
+                "SELECT day, time, product, packaging, size, qty, amount, order_id FROM sales "
+                "WHERE order_id = ? ORDER BY sheet, row",
+                (order_id,)
+            )]
+
+    def aggregate(self, start_day, end_day, by="day"):
+        columns = ", ".join(GROUPINGS[by])
+        query = (
+            f"SELECT {columns}, SUM(qty) AS qty, SUM(amount) AS amount FROM sales "
+            f"WHERE day BETWEEN ? AND ? GROUP BY {columns} ORDER BY {columns}"
+        )
+        with self._lock:
+            return pd.read_sql_query(query, self._conn, params=(start_day, end_day))
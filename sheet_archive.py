@@ -0,0 +1,284 @@
+import argparse
+import logging
+import os
+import re
+import sys
+import threading
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+import pandas as pd
+
+from daily_rollover import SALESLOG_CLEAR_RANGE
+from sales_store import to_number
+from sheets_client import SheetsConnection, load_credentials
+from sheets_scheduler import BACKGROUND, sheets_lane
+from sku_catalog import SKUS
+from store_config import (
+    SHEET_NAME, SALESLOG_NAME, SPREADSHEET_ID, COUNTER_RANGE, SALESLOG_COLUMNS, STOCK_COLUMNS, STOCK_ITEMS,
+    STOCK_RANGES, manila_now
+)
+
+# --- Daily Sheet Archival ---
+# Two tabs a day add up to hundreds, and every worksheets() / open_by_key
+# call pays for all of them. Days older than the cutoff are copied, a
+# month at a time, into Archive_<name>_YYYY-MM sheets and/or zstd Parquet
+# files, each with one bulk append. A day's tabs are only deleted once
+# every destination holds exactly its rows, and all deletions go out in
+# one batchUpdate. Reruns skip days that are already archived, so an
+# interrupted run can simply be repeated.
+ARCHIVE_AFTER_DAYS = 31
+MIN_KEEP_DAYS = 7  # voids and late journal flushes still write to recent days
+ARCHIVE_INTERVAL = 24 * 60 * 60  # seconds between scheduled runs
+INVENTORY_ARCHIVE_COLUMNS = ["Date", "Item", "Sold", "Beg. Bal", "Qty. In", "Ending Bal"]
+COLUMNS = {"sales": SALESLOG_COLUMNS, "inventory": INVENTORY_ARCHIVE_COLUMNS}
+DAILY_TITLE = re.compile(r"^(.+)_(\d{4}-\d{2})-\d{2}$")
+
+log = logging.getLogger(__name__)
+
+def archive_cutoff(keep_days):
+    # Days before this one are archived
+    return (manila_now() - timedelta(days=keep_days)).strftime("%Y-%m-%d")
+
+def a1(title, range_name):
+    return "'" + title.replace("'", "''") + "'!" + range_name
+
+def daily_sheets(worksheets, before_day):
+    # {month: {day: {"sales": ws, "inventory": ws}}} for days before the cutoff
+    kinds = {SALESLOG_NAME: "sales", SHEET_NAME: "inventory"}
+    months = defaultdict(lambda: defaultdict(dict))
+    for ws in worksheets:
+        match = DAILY_TITLE.match(ws.title)
+        if not match or match.group(1) not in kinds:
+            continue
+        day = ws.title[len(match.group(1)) + 1:]
+        if day < before_day:
+            months[match.group(2)][day][kinds[match.group(1)]] = ws
+    return months
+
+# --- Row layout ---
+def number(value):
+    # Sheet text back to a number; blanks stay blank
+    if value in (None, ""):
+        return None
+    amount = to_number(value)
+    return int(amount) if amount.is_integer() else amount
+
+def sales_rows(values):
+    rows = []
+    for row in values:
+        row = list(row) + [""] * (len(SALESLOG_COLUMNS) - len(row))
+        date, time_str, product, packaging, size, qty, amount, order_id = row[:len(SALESLOG_COLUMNS)]
+        if product:
+            rows.append([date, time_str, product, packaging, size, number(qty) or 0, number(amount) or 0, order_id])
+    return rows
+
+def inventory_rows(day, counters, *stock_values):
+    # One row per SKU counter, then one per stock item that has any value
+    counter_row = counters[0] if counters else []
+    rows = [
+        [day, sku.label, number(counter_row[i]) if i < len(counter_row) else 0, None, None, None]
+        for i, sku in enumerate(SKUS)
+    ]
+    for i, item in enumerate(STOCK_ITEMS):
+        balances = [number(column[i][0]) if i < len(column) and column[i] else None for column in stock_values]
+        if any(value is not None for value in balances):
+            rows.append([day, item, None] + balances)
+    return rows
+
+def read_month(spreadsheet, days):
+    # Every daily tab of the month in one values:batchGet.
+    # Returns {kind: {day: rows}}; a missing tab archives as no rows.
+    ranges = []
+    for day, sheets in sorted(days.items()):
+        if "sales" in sheets:
+            ranges.append(a1(sheets["sales"].title, SALESLOG_CLEAR_RANGE))
+        if "inventory" in sheets:
+            ranges += [a1(sheets["inventory"].title, r) for r in [COUNTER_RANGE] + STOCK_RANGES]
+    value_ranges = iter(spreadsheet.values_batch_get(ranges)["valueRanges"])
+    rows = {"sales": {}, "inventory": {}}
+    for day, sheets in sorted(days.items()):
+        rows["sales"][day] = sales_rows(next(value_ranges).get("values", [])) if "sales" in sheets else []
+        if "inventory" in sheets:
+            values = [next(value_ranges).get("values", []) for _ in range(1 + len(STOCK_COLUMNS))]
+            rows["inventory"][day] = inventory_rows(day, *values)
+        else:
+            rows["inventory"][day] = []
+    return rows
+
+# --- Destinations ---
+class SheetsArchive:
+    def __init__(self, spreadsheet, month, worksheets):
+        self.spreadsheet = spreadsheet
+        self.titles = {kind: f"Archive_{name}_{month}" for kind, name in (("sales", SALESLOG_NAME), ("inventory", SHEET_NAME))}
+        self.worksheets = {kind: worksheets.get(title) for kind, title in self.titles.items()}
+
+    def __str__(self):
+        return ", ".join(self.titles.values())
+
+    def counts(self):
+        # Archived rows per day, from the Date column of both sheets in one read
+        kinds = [kind for kind, ws in self.worksheets.items() if ws is not None]
+        counts = {kind: Counter() for kind in COLUMNS}
+        if kinds:
+            value_ranges = self.spreadsheet.values_batch_get([a1(self.titles[kind], "A2:A") for kind in kinds])["valueRanges"]
+            for kind, value_range in zip(kinds, value_ranges):
+                counts[kind].update(row[0] for row in value_range.get("values", []) if row)
+        return counts
+
+    def append(self, rows):
+        for kind, new_rows in rows.items():
+            if not new_rows:
+                continue
+            ws = self.worksheets[kind]
+            if ws is None:
+                ws = self.worksheets[kind] = self.spreadsheet.add_worksheet(self.titles[kind], rows=1, cols=len(COLUMNS[kind]))
+                new_rows = [COLUMNS[kind]] + new_rows
+            # RAW keeps dates and order IDs exactly as logged
+            ws.append_rows(new_rows, value_input_option="RAW")
+
+class ParquetArchive:
+    def __init__(self, directory, month):
+        self.paths = {kind: os.path.join(directory, f"{kind}_{month}.parquet") for kind in COLUMNS}
+
+    def __str__(self):
+        return ", ".join(self.paths.values())
+
+    def read(self, kind):
+        path = self.paths[kind]
+        return pd.read_parquet(path) if os.path.exists(path) else pd.DataFrame(columns=COLUMNS[kind])
+
+    def counts(self):
+        return {kind: Counter(self.read(kind)["Date"]) for kind in COLUMNS}
+
+    def append(self, rows):
+        for kind, new_rows in rows.items():
+            if not new_rows:
+                continue
+            existing = self.read(kind)
+            frames = [existing] if len(existing) else []
+            frame = pd.concat(frames + [pd.DataFrame(new_rows, columns=COLUMNS[kind])], ignore_index=True)
+            # Written aside and swapped in, so a crash never leaves half a file
+            tmp_path = f"{self.paths[kind]}.tmp"
+            frame.to_parquet(tmp_path, compression="zstd", index=False)
+            os.replace(tmp_path, self.paths[kind])
+
+# --- Archival ---
+def archive_month(rows, destinations, dry_run=False):
+    # Appends each day's rows wherever they are missing and returns the days
+    # every destination now holds exactly. A day a destination holds a
+    # different number of rows for is left alone and reported.
+    expected = {kind: Counter({day: len(day_rows) for day, day_rows in rows[kind].items()}) for kind in COLUMNS}
+    days = sorted(rows["sales"])
+    mismatched = set()
+    for destination in destinations:
+        counts = destination.counts()
+        missing = {kind: [] for kind in COLUMNS}
+        for kind in COLUMNS:
+            for day in days:
+                if counts[kind][day] == 0:
+                    missing[kind] += rows[kind][day]
+                elif counts[kind][day] != expected[kind][day]:
+                    mismatched.add(day)
+                    log.warning("%s holds %s %s rows for %s, expected %s", destination, counts[kind][day], kind, day, expected[kind][day])
+        if not dry_run:
+            destination.append(missing)
+    if dry_run:
+        return [day for day in days if day not in mismatched], sorted(mismatched)
+    # Verify against what is actually stored now
+    verified = set(days)
+    for destination in destinations:
+        counts = destination.counts()
+        verified -= {day for kind in COLUMNS for day in days if counts[kind][day] != expected[kind][day]}
+    return sorted(verified), sorted(set(days) - verified)
+
+def archive(spreadsheet, keep_days=ARCHIVE_AFTER_DAYS, to_sheets=True, parquet_dir=None, dry_run=False):
+    if keep_days < MIN_KEEP_DAYS:
+        raise ValueError(f"Refusing to archive days newer than {MIN_KEEP_DAYS} days")
+    if not to_sheets and not parquet_dir:
+        raise ValueError("Nothing to archive to: enable archive sheets or give a Parquet directory")
+    if parquet_dir:
+        os.makedirs(parquet_dir, exist_ok=True)
+    worksheets = spreadsheet.worksheets()
+    by_title = {ws.title: ws for ws in worksheets}
+    report = []
+    deletable = []
+    for month, days in sorted(daily_sheets(worksheets, archive_cutoff(keep_days)).items()):
+        destinations = []
+        if to_sheets:
+            destinations.append(SheetsArchive(spreadsheet, month, by_title))
+        if parquet_dir:
+            destinations.append(ParquetArchive(parquet_dir, month))
+        try:
+            rows = read_month(spreadsheet, days)
+            archived, kept = archive_month(rows, destinations, dry_run)
+        except Exception as e:
+            log.exception("Archiving %s failed", month)
+            report.append({"month": month, "days": len(days), "archived": [], "kept": sorted(days), "error": str(e)})
+            continue
+        deletable += [ws for day in archived for ws in days[day].values()]
+        report.append({
+            "month": month,
+            "days": len(days),
+            "sales_rows": sum(map(len, rows["sales"].values())),
+            "inventory_rows": sum(map(len, rows["inventory"].values())),
+            "archived": archived,
+            "kept": kept,
+        })
+    if deletable and not dry_run:
+        spreadsheet.batch_update({"requests": [{"deleteSheet": {"sheetId": ws.id}} for ws in deletable]})
+    return report, [ws.title for ws in deletable]
+
+# --- Scheduled Archival ---
+class ArchiveScheduler(threading.Thread):
+    def __init__(self, get_spreadsheet, keep_days=ARCHIVE_AFTER_DAYS, parquet_dir=None, interval=ARCHIVE_INTERVAL):
+        super().__init__(name="sheet-archive", daemon=True)
+        self.get_spreadsheet = get_spreadsheet
+        self.keep_days = keep_days
+        self.parquet_dir = parquet_dir
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                with sheets_lane(BACKGROUND):
+                    _, deleted = archive(self.get_spreadsheet(), self.keep_days, parquet_dir=self.parquet_dir)
+                if deleted:
+                    log.info("Archived and deleted %s daily sheets", len(deleted))
+            except Exception:
+                log.exception("Scheduled archival failed; retrying in %ss", self.interval)
+            self._stopped.wait(self.interval)
+
+# --- CLI ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive old daily sheets into monthly sheets and/or Parquet files.")
+    parser.add_argument("--keep-days", type=int, default=ARCHIVE_AFTER_DAYS, help="leave this many recent days in place")
+    parser.add_argument("--parquet", metavar="DIR", help="also write monthly zstd Parquet files to DIR")
+    parser.add_argument("--no-sheets", action="store_true", help="don't write monthly archive sheets (needs --parquet)")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be archived without writing or deleting")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    connection = SheetsConnection(load_credentials(), SPREADSHEET_ID)
+    try:
+        with sheets_lane(BACKGROUND):
+            report, deleted = archive(connection.spreadsheet(), args.keep_days, not args.no_sheets, args.parquet, args.dry_run)
+    except ValueError as e:
+        parser.error(str(e))
+    for month in report:
+        line = f"{month['month']}: {len(month['archived'])}/{month['days']} days archived"
+        if "error" in month:
+            line += f" (failed: {month['error']})"
+        else:
+            line += f", {month['sales_rows']} sales rows, {month['inventory_rows']} inventory rows"
+        if month["kept"]:
+            line += f"; kept {', '.join(month['kept'])}"
+        print(line)
+    print(f"{'Would delete' if args.dry_run else 'Deleted'} {len(deleted)} daily sheets")
+    return 1 if any(month["kept"] for month in report) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
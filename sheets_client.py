@@ -0,0 +1,73 @@
+import base64
+import json
+import os
+import threading
+from functools import partial
+from datetime import datetime, timedelta, timezone
+
+import gspread
+from google.auth.transport.requests import AuthorizedSession, Request
+from google.oauth2.service_account import Credentials
+from requests.adapters import HTTPAdapter
+
+from sheets_scheduler import RequestScheduler, ScheduledHTTPClient
+
+# --- Shared Google Sheets Connection ---
+# One authorized client per process: a pooled keep-alive HTTP session,
+# proactive token refresh, a single opened spreadsheet handle and one
+# request scheduler that every gspread call goes through.
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+REFRESH_MARGIN = timedelta(minutes=10)
+
+def load_credentials():
+    # Decode base64 secret
+    creds_b64 = os.environ["GOOGLE_SERVICE_ACCOUNT_B64"]
+    creds_dict = json.loads(base64.b64decode(creds_b64).decode("utf-8"))
+    return Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
+
+def utcnow():
+    # google-auth keeps token expiry as a naive UTC datetime
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class SheetsConnection:
+    def __init__(self, credentials, spreadsheet_id, pool_size=16, scheduler=None, timeout=None):
+        self.credentials = credentials
+        self.spreadsheet_id = spreadsheet_id
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._spreadsheet = None
+        # Token requests go out on their own plain session: refreshing through
+        # the AuthorizedSession would try to authorize the refresh itself
+        self._token_request = Request()
+        session = AuthorizedSession(credentials)
+        # Keep-alive connections shared by every session and background thread
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        self.session = session
+        self.scheduler = scheduler or RequestScheduler()
+        self.client = gspread.authorize(
+            credentials,
+            http_client=partial(ScheduledHTTPClient, scheduler=self.scheduler, before_request=self.ensure_fresh),
+            session=session
+        )
+        if timeout is not None:
+            # Seconds per HTTP request; by default requests wait indefinitely
+            self.client.set_timeout(timeout)
+
+    def ensure_fresh(self):
+        # Runs before every Sheets request, cached worksheet handles included,
+        # and refreshes well before expiry rather than after a failed request
+        expiry = getattr(self.credentials, "expiry", None)
+        if self.credentials.valid and expiry and expiry - utcnow() > REFRESH_MARGIN:
+            return
+        with self._refresh_lock:
+            expiry = getattr(self.credentials, "expiry", None)
+            if not self.credentials.valid or not expiry or expiry - utcnow() <= REFRESH_MARGIN:
+                self.credentials.refresh(self._token_request)
+
+    def spreadsheet(self):
+        if self._spreadsheet is None:
+            with self._lock:
+                if self._spreadsheet is None:
+                    self._spreadsheet = self.client.open_by_key(self.spreadsheet_id)
+        return self._spreadsheet
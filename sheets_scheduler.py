@@ -0,0 +1,203 @@
+import contextvars
+import json
+import random
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+
+import gspread
+from gspread.http_client import HTTPClient
+
+from metrics import METRICS, current_rerun
+
+# --- Sheets Request Scheduler ---
+# Every gspread call in the process goes through one scheduler: a token
+# bucket per quota (reads, writes), priority lanes, coalescing of
+# identical in-flight reads and a shared 429 backoff.
+
+# Google Sheets allows 60 read and 60 write requests per minute for one
+# service account. A bucket of BURST tokens refilling at
+# (QUOTA - BURST) per minute can never exceed QUOTA in any 60 s window.
+QUOTA_PER_MINUTE = 60
+BURST = 10
+MAX_RETRIES = 5
+MAX_BACKOFF = 32.0  # seconds
+INTERACTIVE_MAX_WAIT = 5.0  # seconds a script-thread call may queue for a token
+
+# Lanes, highest priority first
+COMMIT = 0      # journal flushes
+USER = 1        # direct user actions (stocks save, sheet resolution)
+REFRESH = 2     # dashboard / counter snapshot reads
+BACKGROUND = 3  # rollover and other housekeeping
+LANES = (COMMIT, USER, REFRESH, BACKGROUND)
+LANE_NAMES = {COMMIT: "commit", USER: "user", REFRESH: "refresh", BACKGROUND: "background"}
+
+# Calls in these lanes made during a Streamlit script run (metrics.start_rerun)
+# never sleep on a 429; they fail fast with RateLimited and the UI falls back
+# to cached data. Background threads and the CLIs wait their turn whatever
+# the lane, so the default lane is only non-blocking on the script thread.
+NON_BLOCKING_LANES = {USER, REFRESH}
+
+_lane = contextvars.ContextVar("sheets_lane", default=USER)
+
+@contextmanager
+def sheets_lane(lane):
+    token = _lane.set(lane)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Google Sheets is busy, try again in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+class RequestScheduler:
+    def __init__(self, quota_per_minute=QUOTA_PER_MINUTE, burst=BURST, max_retries=MAX_RETRIES):
+        self.burst = burst
+        self.refill_per_second = (quota_per_minute - burst) / 60.0
+        self.max_retries = max_retries
+        self._cond = threading.Condition()
+        self._tokens = {"read": float(burst), "write": float(burst)}
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._waiting = {(bucket, lane): 0 for bucket in self._tokens for lane in LANES}
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+    # --- Token bucket with priority lanes ---
+    def _refill(self, now):
+        # Caller holds the condition
+        gained = (now - self._refilled_at) * self.refill_per_second
+        for bucket in self._tokens:
+            self._tokens[bucket] = min(self.burst, self._tokens[bucket] + gained)
+        self._refilled_at = now
+
+    def _acquire(self, bucket, lane, timeout):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._waiting[(bucket, lane)] += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    # A lane only gets a token when no higher-priority lane is queued
+                    ahead = any(self._waiting[(bucket, other)] for other in LANES if other < lane)
+                    if now >= self._paused_until and not ahead and self._tokens[bucket] >= 1:
+                        self._tokens[bucket] -= 1
+                        return True
+                    wait = max(
+                        self._paused_until - now,
+                        (1 - self._tokens[bucket]) / self.refill_per_second,
+                        0.01
+                    )
+                    if deadline is not None:
+                        if now >= deadline:
+                            return False
+                        wait = min(wait, deadline - now)
+                    self._cond.wait(wait)
+            finally:
+                self._waiting[(bucket, lane)] -= 1
+                self._cond.notify_all()
+
+    def _pause(self, delay):
+        # One 429 slows every session down, not just the one that hit it
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._cond.notify_all()
+
+    def retry_after(self):
+        with self._cond:
+            return max(0.0, self._paused_until - time.monotonic())
+
+    # --- Execution ---
+    def _blocking(self, lane, rerun):
+        return rerun is None or lane not in NON_BLOCKING_LANES
+
+    def _execute(self, bucket, call):
+        lane = _lane.get()
+        rerun = current_rerun()
+        blocking = self._blocking(lane, rerun)
+        # Script-thread calls are labelled with the app section that made them
+        labels = {"bucket": bucket, "lane": LANE_NAMES[lane], "section": rerun.current if rerun else "background"}
+        for attempt in range(self.max_retries + 1):
+            queued_at = time.perf_counter()
+            acquired = self._acquire(bucket, lane, None if blocking else INTERACTIVE_MAX_WAIT)
+            started = time.perf_counter()
+            METRICS.observe("sheets_queue_seconds", started - queued_at, bucket=bucket, lane=labels["lane"])
+            if not acquired:
+                METRICS.inc("sheets_rate_limited_total", **labels)
+                raise RateLimited(max(self.retry_after(), 1.0))
+            if rerun is not None:
+                rerun.count_call(bucket)
+            try:
+                result = call()
+            except gspread.exceptions.APIError as e:
+                METRICS.inc("sheets_requests_total", status=str(e.code), **labels)
+                if e.code != 429 or attempt == self.max_retries:
+                    raise
+                # Full jitter, shared by all lanes through the pause
+                delay = random.uniform(0.5, 1.0) * min(MAX_BACKOFF, 2 ** attempt)
+                self._pause(delay)
+                if not blocking:
+                    METRICS.inc("sheets_rate_limited_total", **labels)
+                    raise RateLimited(delay) from e
+                METRICS.inc("sheets_retries_total", **labels)
+                continue
+            METRICS.inc("sheets_requests_total", status="ok", **labels)
+            METRICS.observe("sheets_request_seconds", time.perf_counter() - started, bucket=bucket, lane=labels["lane"])
+            return result
+
+    def submit(self, bucket, call, key=None):
+        # A journal flush reads the counters it writes absolute values from;
+        # joining a read sent before its previous write would lose those sales
+        if key is None or _lane.get() == COMMIT:
+            return self._execute(bucket, call)
+        # Identical reads already on the wire are shared, not repeated
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            METRICS.inc("sheets_coalesced_total", bucket=bucket)
+            lane, rerun = _lane.get(), current_rerun()
+            if self._blocking(lane, rerun):
+                return future.result()
+            # The leader may be a blocking call sleeping through a 429
+            try:
+                return future.result(timeout=INTERACTIVE_MAX_WAIT)
+            except FutureTimeout:
+                METRICS.inc("sheets_rate_limited_total", bucket=bucket, lane=LANE_NAMES[lane], section=rerun.current)
+                raise RateLimited(max(self.retry_after(), 1.0))
+        try:
+            result = self._execute(bucket, call)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+# --- gspread integration ---
+class ScheduledHTTPClient(HTTPClient):
+    def __init__(self, auth, session=None, scheduler=None, before_request=None):
+        super().__init__(auth, session)
+        self.scheduler = scheduler or RequestScheduler()
+        self.before_request = before_request
+
+    def request(self, method, endpoint, params=None, data=None, json=None, files=None, headers=None):
+        if self.before_request is not None:
+            self.before_request()
+        send = super().request
+        call = lambda: send(method, endpoint, params=params, data=data, json=json, files=files, headers=headers)
+        if method.lower() == "get":
+            return self.scheduler.submit("read", call, key=request_key(endpoint, params))
+        return self.scheduler.submit("write", call)
+
+def request_key(endpoint, params):
+    return endpoint + "?" + json.dumps(params, sort_keys=True, default=str)
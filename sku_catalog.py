@@ -0,0 +1,51 @@
+import numpy as np
+from typing import NamedTuple
+
+from store_config import COUNTER_CELLS, cell_map, price_map
+
+# --- SKU Catalog ---
+# Compiled once from cell_map and price_map: one index per SKU, in the
+# same order as the counter row, so totals are a single dot product.
+
+class Sku(NamedTuple):
+    index: int
+    product: str
+    packaging: str
+    size: str  # size, or flavor for pizza
+    cell: str
+    price: int
+    label: str
+
+def unit_price(packaging, size, prices=price_map):
+    prices = prices[packaging]
+    return prices[size] if size in prices else prices["Others"]
+
+def build_catalog(cells=cell_map, prices=price_map):
+    # Defaults to this server's branch; other branches pass their own maps
+    skus = []
+    for product, packagings in cells.items():
+        for packaging, sizes in packagings.items():
+            for size, cell in sizes.items():
+                # Only mention the packaging when the product comes in more than one
+                label = f"{product} - {packaging} - {size}" if len(packagings) > 1 else f"{product} - {size}"
+                skus.append(Sku(len(skus), product, packaging, size, cell, unit_price(packaging, size, prices), label))
+    return skus
+
+SKUS = build_catalog()
+assert [sku.cell for sku in SKUS] == COUNTER_CELLS
+SKU_INDEX = {(sku.product, sku.packaging, sku.size): sku.index for sku in SKUS}
+CELL_INDEX = {sku.cell: sku.index for sku in SKUS}
+PRICES = np.array([sku.price for sku in SKUS], dtype=np.int64)
+
+def find_sku(product, packaging, size):
+    return SKUS[SKU_INDEX[(product, packaging, size)]]
+
+def cart_vector(cart):
+    # cart maps SKU index -> quantity
+    qty = np.zeros(len(SKUS), dtype=np.int64)
+    for sku_index, item_qty in cart.items():
+        qty[sku_index] += item_qty
+    return qty
+
+def sales_total(counts):
+    return int(np.dot(np.asarray(counts, dtype=np.int64), PRICES))
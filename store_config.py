@@ -0,0 +1,119 @@
+import json
+import os
+from datetime import datetime
+from typing import NamedTuple
+import pytz
+
+# --- Google Sheets Setup ---
+TIMEZONE = pytz.timezone("Asia/Manila")
+
+def manila_now():
+    return datetime.now(TIMEZONE)
+
+# --- Cell Map Matching Excel Structure ---
+cell_map = {
+    "Buko Juice": {
+        "Cup": {
+            "Small": "C6",
+            "Medium": "D6",
+            "Large": "E6"
+        },
+        "Bottle": {
+            "Small": "F6",
+            "Medium": "G6",
+            "Large": "H6"
+        }
+    },
+    "Buko Shake": {
+        "Cup": {
+            "Small": "I6",
+            "Medium": "J6",
+            "Large": "K6"
+        },
+        "Bottle": {
+            "Small": "L6",
+            "Medium": "M6",
+            "Large": "N6"
+        }
+    },
+    "Pizza": {
+        "Box": {
+            "Supreme": "O6",
+            "Hawaiian": "P6",
+            "Pepperoni": "Q6",
+            "Ham & Cheese": "R6",
+            "Shawarma": "S6"
+        }
+    }
+}
+
+# --- Prices ---
+price_map = {
+    "Cup": {"Small": 65, "Medium": 75, "Large": 95},
+    "Bottle": {"Small": 65, "Medium": 75, "Large": 115},
+    "Box": {"Supreme": 250, "Others": 190}
+}
+
+# --- Branch Registry ---
+# One entry per stall, each with its own spreadsheet, tab names and
+# catalog. More stalls go in BRANCHES_FILE (a JSON list of Branch fields;
+# anything left out is copied from the first branch). A server serves
+# STORE_BRANCH, the first branch by default, and the module-level names
+# below all describe that branch.
+class Branch(NamedTuple):
+    key: str
+    name: str
+    spreadsheet_id: str
+    sheet_name: str
+    saleslog_name: str
+    cell_map: dict
+    price_map: dict
+
+BRANCHES = {
+    "mighteemart1": Branch(
+        "mighteemart1", "MighteeMart1", "1rNAba2jqzBqzXZZxplfkXc5XthDbgVVvntDOIdDEx9w",
+        "MighteeMart1", "SalesLog", cell_map, price_map
+    ),
+}
+BRANCHES_FILE = os.environ.get("BRANCHES_FILE", "branches.json")
+
+def load_branches(path, defaults):
+    with open(path) as f:
+        entries = json.load(f)
+    return {entry["key"]: defaults._replace(**entry) for entry in entries}
+
+if os.path.exists(BRANCHES_FILE):
+    BRANCHES.update(load_branches(BRANCHES_FILE, next(iter(BRANCHES.values()))))
+
+BRANCH = BRANCHES[os.environ.get("STORE_BRANCH") or next(iter(BRANCHES))]
+SHEET_NAME = BRANCH.sheet_name
+SALESLOG_NAME = BRANCH.saleslog_name
+SPREADSHEET_ID = BRANCH.spreadsheet_id
+cell_map = BRANCH.cell_map
+price_map = BRANCH.price_map
+
+# --- Sales Counter Row ---
+# All sales counters live in one contiguous row, so a single range read
+# replaces the per-cell acell() round trips.
+def counter_cells(cells):
+    return [cell for product in cells.values() for packaging in product.values() for cell in packaging.values()]
+
+def counter_range(cells):
+    cells = counter_cells(cells)
+    return f"{cells[0]}:{cells[-1]}"
+
+COUNTER_CELLS = counter_cells(cell_map)
+COUNTER_RANGE = counter_range(cell_map)  # C6:S6
+
+# --- Stocks Inventory Rows ---
+# Raw stock items, one per row from STOCK_START_ROW down, with
+# Beg. Bal in G, Qty. In in I and Ending Bal in M.
+STOCK_ITEMS = [
+    "Milk", "Sugar", "buko", "S-Bottle", "M-Bottle", "L-Bottle", "S-Cup", "M-Cup", "L-Cup", "Dough", "Pizza sauce", "Ham", "Pepperoni", "Pineapple", "Beep/Bacon", "W Onion", "Bellpepper", "Mushroom", "Hot Sauce", "Catsup", "Beef Shawarma", "Pizza Cheese", "Mozza Cheese", "Pizza Box", "Ice", "Plastic Twine", "Tissue", "Spoon", "Straw", "Sando bag", "Carrier bag", "Siomai"
+]
+STOCK_START_ROW = 17
+STOCK_COLUMNS = {"Beg. Bal": "G", "Qty. In": "I", "Ending Bal": "M"}
+STOCK_RANGES = [f"{col}{STOCK_START_ROW}:{col}{STOCK_START_ROW + len(STOCK_ITEMS) - 1}" for col in STOCK_COLUMNS.values()]
+
+# --- SalesLog Columns ---
+SALESLOG_COLUMNS = ["Date", "Time", "Product", "Packaging", "Size/Flavor", "Qty", "Amount", "Order ID"]